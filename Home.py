@@ -1,24 +1,26 @@
 import streamlit as st 
 from datetime import datetime, timedelta
-import yfinance as yf
 import plotly.express as px
 import time
+from marketData import get_provider
 st.set_page_config(page_title="Data Board", page_icon="chart_with_upwards_trend", layout='wide')
 
 # Function to fetch real-time stock data during market hours
-@st.cache_resource
+# the shared provider caches intraday bars for a minute, so reruns and other sessions reuse them
 def fetch_realtime_stock_data(ticker_symbol, period, interval):
     current_time = datetime.now().time()
     
     try:
-            stock_data = yf.download(ticker_symbol, period=period, interval=interval)
+            stock_data = get_provider().history(ticker_symbol, period=period, interval=interval)
     except Exception as e:
             # Retry with a different interval if the initial request fails
             if "15m data not available" in str(e):
                 st.warning(f"15-minute data not available for the specified period. Fetching hourly data instead.")
-                stock_data = yf.download(ticker_symbol, period=period, interval="1h")
+                stock_data = get_provider().history(ticker_symbol, period=period, interval="1h")
             else:
                 raise
+    if stock_data.empty:
+        return None
     return stock_data
     
 
@@ -34,14 +36,17 @@ nse_stock_data = fetch_realtime_stock_data(nse_ticker_symbol, default_period, de
 sensex_ticker_symbol = "^BSESN"
 sensex_stock_data = fetch_realtime_stock_data(sensex_ticker_symbol, default_period, default_interval)
 
-# Calculate the percentage change for NSE
-nse_percentage_change = (nse_stock_data['Close'].iloc[-1] - nse_stock_data['Close'].iloc[0]) / nse_stock_data['Close'].iloc[0] * 100
+if nse_stock_data is not None and sensex_stock_data is not None:
+    # Calculate the percentage change for NSE
+    nse_percentage_change = (nse_stock_data['Close'].iloc[-1] - nse_stock_data['Close'].iloc[0]) / nse_stock_data['Close'].iloc[0] * 100
 
-# Calculate the percentage change for Sensex
-sensex_percentage_change = (sensex_stock_data['Close'].iloc[-1] - sensex_stock_data['Close'].iloc[0]) / sensex_stock_data['Close'].iloc[0] * 100
+    # Calculate the percentage change for Sensex
+    sensex_percentage_change = (sensex_stock_data['Close'].iloc[-1] - sensex_stock_data['Close'].iloc[0]) / sensex_stock_data['Close'].iloc[0] * 100
 
-# Determine overall market condition
-overall_market_condition = 'Bullish' if nse_percentage_change > 0 and sensex_percentage_change > 0 else 'Bearish'
+    # Determine overall market condition
+    overall_market_condition = 'Bullish' if nse_percentage_change > 0 and sensex_percentage_change > 0 else 'Bearish'
+else:
+    overall_market_condition = 'Unknown'
 
 
 def plot_chart(stock_data, title, subheader):
@@ -83,9 +88,8 @@ if not ticker_needed:
     with st.spinner("Enter a stock ticker to fetch data"):
         ticker_needed = st.text_input("Enter a stock ticker")
 
-@st.cache_resource
 def print_Details(ticker_needed:str):
-    ticker_needed = yf.Ticker(ticker_needed)
+    ticker_needed = get_provider().ticker(ticker_needed)
     return ticker_needed
 
 
@@ -124,7 +128,9 @@ def print_tables(ticker_needed,cont_height:int=500):
             st.subheader("Cash Flow Statement")
             st.write(ticker_needed.cashflow)
 
-if ticker_needed:
+if ticker_needed and get_provider().offline:
+    st.warning("Company financials need network access, QuantQuips is running offline.")
+elif ticker_needed:
     if  st.session_state["ticker_cached"].get(ticker_needed) == None :
             st.session_state["ticker_cached"]|={ticker_needed:print_Details(ticker_needed)}
             with st.spinner("Crunching Numbers"):
@@ -0,0 +1,166 @@
+# Performance analytics for backtest equity curves
+#
+# Every function works along the last axis, so it takes one equity curve (bars,) or a whole
+# matrix of them (curves, bars) from an optimizer sweep or a universe run and answers for all
+# of them in the same numpy pass. Positions are per-bar holdings as recorded by the runs;
+# trades, when a run provides them, are closed-trade profits, otherwise round trips are read
+# off the position path (a trade lasts while the position keeps the same sign).
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+
+def periods_per_year(dates) -> float:
+    """Bars per year implied by a date index, TRADING_DAYS when it cannot be told."""
+    if dates is None or len(dates) < 2:
+        return float(TRADING_DAYS)
+    dates = np.asarray(dates, dtype="datetime64[ns]")
+    years = (dates[-1] - dates[0]) / np.timedelta64(1, "D") / 365.25
+    return (len(dates) - 1) / years if years > 0 else float(TRADING_DAYS)
+
+def returns(equity) -> np.ndarray:
+    """Per-bar simple returns, one shorter than equity; NaN where the previous value is not positive."""
+    equity = np.asarray(equity, dtype=np.float64)
+    previous = equity[..., :-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(previous > 0, equity[..., 1:] / previous - 1.0, np.nan)
+
+def total_return(equity) -> np.ndarray:
+    equity = np.asarray(equity, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return equity[..., -1] / equity[..., 0] - 1.0
+
+def cagr(equity, periodsPerYear:float = TRADING_DAYS) -> np.ndarray:
+    equity = np.asarray(equity, dtype=np.float64)
+    years = (equity.shape[-1] - 1) / periodsPerYear
+    growth = equity[..., -1] / equity[..., 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # a curve that ends at or below zero has lost everything
+        return np.where(growth > 0, np.power(np.maximum(growth, 0.0), 1.0 / years) - 1.0, -1.0) if years > 0 else growth - 1.0
+
+def sharpe(equity, periodsPerYear:float = TRADING_DAYS, riskFree:float = 0.0) -> np.ndarray:
+    """Annualized Sharpe ratio of per-bar returns; riskFree is an annual rate."""
+    excess = returns(equity) - riskFree / periodsPerYear
+    with np.errstate(divide="ignore", invalid="ignore"):
+        deviation = np.nanstd(excess, axis=-1, ddof=1)
+        return np.where(deviation > 0, np.nanmean(excess, axis=-1) / deviation * np.sqrt(periodsPerYear), np.nan)
+
+def sortino(equity, periodsPerYear:float = TRADING_DAYS, riskFree:float = 0.0) -> np.ndarray:
+    """Annualized Sortino ratio, downside deviation taken against zero excess return."""
+    excess = returns(equity) - riskFree / periodsPerYear
+    with np.errstate(divide="ignore", invalid="ignore"):
+        downside = np.sqrt(np.nanmean(np.minimum(excess, 0.0) ** 2, axis=-1))
+        return np.where(downside > 0, np.nanmean(excess, axis=-1) / downside * np.sqrt(periodsPerYear), np.nan)
+
+def drawdowns(equity) -> np.ndarray:
+    """Fall from the running peak at every bar, as a fraction of that peak."""
+    equity = np.asarray(equity, dtype=np.float64)
+    peaks = np.maximum.accumulate(equity, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(peaks > 0, (peaks - equity) / peaks, 0.0)
+
+def max_drawdown(equity) -> np.ndarray:
+    equity = np.asarray(equity, dtype=np.float64)
+    if equity.shape[-1] == 0:
+        return np.zeros(equity.shape[:-1])
+    return drawdowns(equity).max(axis=-1)
+
+def drawdown_duration(equity) -> np.ndarray:
+    """Longest stretch of bars spent below a previous peak."""
+    equity = np.asarray(equity, dtype=np.float64)
+    index = np.broadcast_to(np.arange(equity.shape[-1]), equity.shape)
+    atPeak = equity >= np.maximum.accumulate(equity, axis=-1)
+    lastPeak = np.maximum.accumulate(np.where(atPeak, index, 0), axis=-1)
+    return (index - lastPeak).max(axis=-1)
+
+def exposure(position) -> np.ndarray:
+    """Share of bars with an open position."""
+    return (np.asarray(position) != 0).mean(axis=-1)
+
+def turnover(position, close, equity, periodsPerYear:float = TRADING_DAYS) -> np.ndarray:
+    """Annualized traded value over average equity."""
+    position = np.asarray(position, dtype=np.float64)
+    traded = np.abs(np.diff(position, axis=-1, prepend=0.0)) * np.asarray(close, dtype=np.float64)
+    bars = position.shape[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        averageEquity = np.abs(np.asarray(equity, dtype=np.float64)).mean(axis=-1)
+        return traded.sum(axis=-1) / averageEquity * periodsPerYear / bars
+
+def round_trips(equity, position):
+    """(row, entry bar, profit) of every closed round trip in the position paths, a row per curve."""
+    equity = np.atleast_2d(np.asarray(equity, dtype=np.float64))
+    side = np.sign(np.atleast_2d(np.asarray(position, dtype=np.float64)))
+    rows, bars = side.shape
+    change = np.diff(equity, axis=-1, prepend=equity[:, :1]).ravel()
+    starts = np.ones((rows, bars), dtype=bool)
+    starts[:, 1:] = side[:, 1:] != side[:, :-1]
+    flatStarts = np.flatnonzero(starts)
+    ends = np.append(flatStarts[1:], side.size) - 1
+    # a trade still held at the last bar is not closed; the others close on the bar after their last
+    closed = (side.ravel()[flatStarts] != 0) & ((ends + 1) % bars != 0)
+    # the exit bar's change is the exit fill and its commission, on a reversal it also holds the
+    # new trade's first bar
+    profits = np.add.reduceat(change, flatStarts)[closed] + change[ends[closed] + 1]
+    return flatStarts[closed] // bars, flatStarts[closed] % bars, profits
+
+def trade_returns(equity, position) -> np.ndarray:
+    """Profit of every closed trade of one run as a fraction of the equity it was opened with."""
+    equity = np.asarray(equity, dtype=np.float64)
+    _, entries, profits = round_trips(equity, position)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return profits / equity[np.maximum(entries - 1, 0)]
+
+def win_rate(equity = None, position = None, trades = None) -> np.ndarray:
+    """Share of winning trades, from closed-trade profits or from the position path."""
+    if trades is not None:
+        trades = np.asarray(trades, dtype=np.float64)
+        return (trades > 0).mean() if len(trades) else np.nan
+    rows, _, profits = round_trips(equity, position)
+    count = np.bincount(rows, minlength=np.atleast_2d(equity).shape[0])
+    wins = np.bincount(rows, weights=profits > 0, minlength=len(count))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = np.where(count > 0, wins / count, np.nan)
+    return rates if np.ndim(equity) > 1 else rates[0]
+
+def performance(equity, position = None, close = None, trades = None, dates = None, riskFree:float = 0.0) -> dict:
+    """Every metric of one equity curve; position and close enable exposure, turnover and win rate."""
+    equity = np.asarray(equity, dtype=np.float64)
+    if len(equity) < 2:
+        return {}
+    perYear = periods_per_year(dates)
+    metrics = {
+        'Return %': float(total_return(equity)) * 100.0,
+        'CAGR %': float(cagr(equity, perYear)) * 100.0,
+        'Sharpe': float(sharpe(equity, perYear, riskFree)),
+        'Sortino': float(sortino(equity, perYear, riskFree)),
+        'Max Drawdown %': float(max_drawdown(equity)) * 100.0,
+        'Drawdown Bars': int(drawdown_duration(equity)),
+    }
+    if position is not None:
+        metrics['Exposure %'] = float(exposure(position)) * 100.0
+        if close is not None:
+            metrics['Turnover'] = float(turnover(position, close, equity, perYear))
+    if trades is not None or position is not None:
+        metrics['Win Rate %'] = float(win_rate(equity, position, trades)) * 100.0
+    return metrics
+
+def performance_table(equity, position = None, close = None, dates = None, riskFree:float = 0.0, index = None) -> pd.DataFrame:
+    """The metrics of every row of a (curves, bars) equity matrix at once."""
+    equity = np.atleast_2d(np.asarray(equity, dtype=np.float64))
+    perYear = periods_per_year(dates)
+    table = {
+        'Return %': total_return(equity) * 100.0,
+        'CAGR %': cagr(equity, perYear) * 100.0,
+        'Sharpe': sharpe(equity, perYear, riskFree),
+        'Sortino': sortino(equity, perYear, riskFree),
+        'Max Drawdown %': max_drawdown(equity) * 100.0,
+        'Drawdown Bars': drawdown_duration(equity),
+    }
+    if position is not None:
+        position = np.atleast_2d(position)
+        table['Exposure %'] = exposure(position) * 100.0
+        if close is not None:
+            table['Turnover'] = turnover(position, close, equity, perYear)
+        table['Win Rate %'] = win_rate(equity, position) * 100.0
+    return pd.DataFrame(table, index=index)
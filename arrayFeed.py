@@ -0,0 +1,213 @@
+# Backtrader data feed and indicators backed by numpy arrays
+#
+# ArrayData preloads straight from PriceArrays, including zero-copy views of shared memory, by
+# copying each column into backtrader's line buffers in one step instead of walking a
+# DataFrame row by row. The SMA, RSI, BollingerBands and MACD helpers return precomputed
+# indicators on an ArrayData: their values come from one vectorBacktest.Indicators set per
+# price series, shared by every strategy and optimizer combination that runs on the same data
+# in the process. On any other feed they return the usual backtrader indicator.
+
+import array
+import threading
+import numpy as np
+import backtrader as bt
+from cachetools import LRUCache
+import vectorBacktest
+
+# backtrader's date numbers count days from 0001-01-01, 1970-01-01 is day 719163
+EPOCH_DATENUM = 719163.0
+NANOS_PER_DAY = 86_400_000_000_000
+
+def date_numbers(dates:np.ndarray) -> np.ndarray:
+    """backtrader date numbers of int64 nanosecond timestamps."""
+    days, nanos = np.divmod(np.asarray(dates, dtype=np.int64), NANOS_PER_DAY)
+    return days + EPOCH_DATENUM + nanos / NANOS_PER_DAY
+
+def datetimes(numbers:np.ndarray) -> np.ndarray:
+    """datetime64[ns] of backtrader date numbers."""
+    nanos = np.round((np.asarray(numbers, dtype=np.float64) - EPOCH_DATENUM) * NANOS_PER_DAY)
+    return nanos.astype(np.int64).view('datetime64[ns]')
+
+class ArrayData(bt.feed.DataBase):
+    params = (
+        ('arrays', None),
+    )
+
+    def __init__(self):
+        self._arrays = self.p.arrays
+        # hold the arrays in one place only, preload releases them
+        self.p.arrays = None
+        self._rows = None
+        self._buffers = None
+        self.digest = None
+
+    def _select(self):
+        # fromdate/todate are only known once the feed has started
+        dates = date_numbers(self._arrays.dates)
+        first = int(np.searchsorted(dates, self.fromdate, side="left"))
+        last = int(np.searchsorted(dates, self.todate, side="right"))
+        self._rows = slice(first, last)
+        self._dates = dates[self._rows]
+        self._close = np.array(self._arrays.close[self._rows], dtype=np.float64)
+        self.digest = self._arrays.digest() if (first, last) == (0, len(dates)) else \
+            f"{self._arrays.digest()}:{first}:{last}"
+
+    def start(self):
+        super().start()
+        self._bar = 0
+
+    def close_values(self) -> np.ndarray:
+        """The close series the feed delivers, as float64."""
+        if self._rows is None:
+            self._select()
+        return self._close
+
+    def preload(self):
+        # optimizer runs preload the same feed once per combination, the buffers are built once
+        if self._buffers is None:
+            self._buffers = self._build_buffers()
+        for name, buffer in self._buffers.items():
+            line = getattr(self.lines, name)
+            line.array = buffer
+            line.idx = len(buffer) - 1
+            line.lencount = len(buffer)
+        # nothing is left for load(), next mode asks it once the buffers run out
+        self._bar = len(self._dates)
+        self._last()
+        self.home()
+
+    def _build_buffers(self) -> dict:
+        if self._rows is None:
+            self._select()
+        columns = {
+            'datetime': self._dates,
+            'open': self._arrays.open[self._rows],
+            'high': self._arrays.high[self._rows],
+            'low': self._arrays.low[self._rows],
+            'close': self._close,
+            'volume': self._arrays.volume[self._rows],
+            'openinterest': self._arrays.openinterest[self._rows],
+        }
+        buffers = {name: array.array('d', np.ascontiguousarray(values, dtype=np.float64).tobytes())
+                   for name, values in columns.items()}
+        # the buffers own copies now, let go of shared memory or memory-mapped views
+        self._arrays = None
+        return buffers
+
+    def _load(self):
+        if self._buffers is not None:
+            # preloaded before, the arrays are gone and the buffers hold the same rows
+            if self._bar >= len(self._dates):
+                return False
+            for name, buffer in self._buffers.items():
+                getattr(self.lines, name)[0] = buffer[self._bar]
+            self._bar += 1
+            return True
+        if self._rows is None:
+            self._select()
+        i = self._rows.start + self._bar
+        if i >= self._rows.stop:
+            return False
+        self.lines.datetime[0] = self._dates[self._bar]
+        self.lines.open[0] = self._arrays.open[i]
+        self.lines.high[0] = self._arrays.high[i]
+        self.lines.low[0] = self._arrays.low[i]
+        self.lines.close[0] = self._arrays.close[i]
+        self.lines.volume[0] = self._arrays.volume[i]
+        self.lines.openinterest[0] = self._arrays.openinterest[i]
+        self._bar += 1
+        return True
+
+_indicator_sets = LRUCache(maxsize=64)
+_indicator_lock = threading.Lock()
+
+def indicator_set(digest:str, close:np.ndarray) -> vectorBacktest.Indicators:
+    """The process-wide indicator set of a close series, keyed by the digest of its prices."""
+    with _indicator_lock:
+        indicators = _indicator_sets.get(digest)
+        if indicators is None:
+            indicators = _indicator_sets[digest] = vectorBacktest.Indicators(np.ascontiguousarray(close, dtype=np.float64))
+        return indicators
+
+def shared_indicators(feed:ArrayData) -> vectorBacktest.Indicators:
+    """The process-wide indicator set of the series feed delivers."""
+    close = feed.close_values()
+    return indicator_set(feed.digest, close)
+
+class _Precomputed(bt.Indicator):
+    # values() returns one full-length array per line, in line order
+    def _columns(self):
+        if not hasattr(self, '_values'):
+            values = self.values(shared_indicators(self.data))
+            self._values = values if isinstance(values, tuple) else (values,)
+        return self._values
+
+    def once(self, start, end):
+        for line, values in zip(self.lines, self._columns()):
+            line.array[start:end] = array.array('d', values[start:end].tobytes())
+
+    def next(self):
+        i = len(self) - 1
+        for line, values in zip(self.lines, self._columns()):
+            line[0] = values[i]
+
+class PrecomputedSMA(_Precomputed):
+    lines = ('sma',)
+    params = (('period', 30),)
+
+    def __init__(self):
+        self.addminperiod(self.p.period)
+
+    def values(self, indicators):
+        return indicators.exact_sma(self.p.period)
+
+class PrecomputedRSI(_Precomputed):
+    lines = ('rsi',)
+    params = (('period', 14),)
+
+    def __init__(self):
+        self.addminperiod(self.p.period + 1)
+
+    def values(self, indicators):
+        return indicators.rsi(self.p.period)
+
+class PrecomputedBollingerBands(_Precomputed):
+    lines = ('mid', 'top', 'bot')
+    params = (('period', 20), ('devfactor', 2.0))
+
+    def __init__(self):
+        self.addminperiod(self.p.period)
+
+    def values(self, indicators):
+        return indicators.exact_bollinger(self.p.period, self.p.devfactor)
+
+class PrecomputedMACD(_Precomputed):
+    lines = ('macd', 'signal', 'histo')
+    params = (('period_me1', 12), ('period_me2', 26), ('period_signal', 9))
+
+    def __init__(self):
+        self.addminperiod(max(self.p.period_me1, self.p.period_me2) + self.p.period_signal - 1)
+
+    def values(self, indicators):
+        line, signal = indicators.macd(self.p.period_me1, self.p.period_me2, self.p.period_signal)
+        return line, signal, line - signal
+
+def SMA(data, period:int):
+    if isinstance(data, ArrayData):
+        return PrecomputedSMA(data, period=period)
+    return bt.indicators.SimpleMovingAverage(data.close, period=period)
+
+def RSI(data, period:int):
+    if isinstance(data, ArrayData):
+        return PrecomputedRSI(data, period=period)
+    return bt.indicators.RelativeStrengthIndex(data.close, period=period)
+
+def BollingerBands(data, period:int, devfactor:float):
+    if isinstance(data, ArrayData):
+        return PrecomputedBollingerBands(data, period=period, devfactor=devfactor)
+    return bt.indicators.BollingerBands(data.close, period=period, devfactor=devfactor)
+
+def MACD(data, period_me1:int, period_me2:int, period_signal:int):
+    if isinstance(data, ArrayData):
+        return PrecomputedMACD(data, period_me1=period_me1, period_me2=period_me2, period_signal=period_signal)
+    return bt.indicators.MACD(data.close, period_me1=period_me1, period_me2=period_me2, period_signal=period_signal)
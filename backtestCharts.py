@@ -0,0 +1,108 @@
+# Compact chart data and on-demand rendering for backtest results
+#
+# EquityRecorder is attached to every backtest run and records the close, portfolio value,
+# position and executed orders per bar, plus the profit of every closed trade. chart_series
+# reduces that to at most a few thousand points with a min/max bucket downsample, so peaks
+# and drawdowns survive while a worker only sends back a few kilobytes. render_png draws the
+# chart from those points only when a page asks for it.
+
+import io
+import numpy as np
+import backtrader as bt
+from matplotlib.figure import Figure
+
+MAX_POINTS = 2000
+CHART_DPI = 100
+
+class EquityRecorder(bt.Analyzer):
+    """Records close, broker value, position and executed orders for every bar of the run."""
+    def start(self):
+        self.dates = []
+        self.close = []
+        self.value = []
+        self.position = []
+        self.orders = []
+        self.trades = []
+
+    def notify_order(self, order):
+        if order.status == order.Completed:
+            self.orders.append((len(self.data) - 1, order.executed.price, order.executed.size))
+
+    def notify_trade(self, trade):
+        if trade.isclosed:
+            self.trades.append(trade.pnlcomm)
+
+    def next(self):
+        self.dates.append(self.data.datetime[0])
+        self.close.append(self.data.close[0])
+        self.value.append(self.strategy.broker.getvalue())
+        self.position.append(self.strategy.position.size)
+
+    def get_analysis(self):
+        return {
+            'dates': np.array(self.dates),
+            'close': np.array(self.close),
+            'equity': np.array(self.value),
+            'position': np.array(self.position, dtype=np.float64),
+            'orders': self.orders,
+            'trades': np.array(self.trades, dtype=np.float64),
+        }
+
+def downsample_indices(values:np.ndarray, maxPoints:int = MAX_POINTS) -> np.ndarray:
+    """Indices of the first, last, minimum and maximum of each bucket, at most maxPoints in total."""
+    n = len(values)
+    if n <= maxPoints:
+        return np.arange(n)
+    buckets = max(1, maxPoints // 4)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    width = int(np.diff(edges).max())
+    # pad every bucket to the same width so argmin/argmax run over one 2-D view
+    rows = edges[:-1, None] + np.arange(width)
+    valid = rows < edges[1:, None]
+    padded = values[np.minimum(rows, n - 1)]
+    low = edges[:-1] + np.argmin(np.where(valid, padded, np.inf), axis=1)
+    high = edges[:-1] + np.argmax(np.where(valid, padded, -np.inf), axis=1)
+    return np.unique(np.concatenate([edges[:-1], edges[1:] - 1, low, high]))
+
+def chart_series(recorded:dict, maxPoints:int = MAX_POINTS) -> dict:
+    """Downsampled price, equity and trade markers from an EquityRecorder analysis."""
+    close, equity = recorded['close'], recorded['equity']
+    keep = np.union1d(downsample_indices(close, maxPoints // 2), downsample_indices(equity, maxPoints // 2))
+    orders = recorded['orders']
+    bars = np.array([bar for bar, _, _ in orders], dtype=np.int64)
+    prices = np.array([price for _, price, _ in orders], dtype=np.float64)
+    sizes = np.array([size for _, _, size in orders], dtype=np.float64)
+    toDate = lambda numbers: np.array([bt.num2date(number) for number in numbers], dtype='datetime64[ns]')
+    return {
+        'dates': toDate(recorded['dates'][keep]),
+        'close': close[keep],
+        'equity': equity[keep],
+        'buys': (toDate(recorded['dates'][bars[sizes > 0]]), prices[sizes > 0]),
+        'sells': (toDate(recorded['dates'][bars[sizes < 0]]), prices[sizes < 0]),
+        'bars': len(close),
+    }
+
+def render_figure(series:dict, title:str = None) -> Figure:
+    # a bare Figure is not registered with pyplot, it is freed as soon as the caller drops it
+    figure = Figure(figsize=(10, 6), dpi=CHART_DPI)
+    price, equity = figure.subplots(2, 1, sharex=True, gridspec_kw={'height_ratios': [2, 1]})
+    price.plot(series['dates'], series['close'], color='tab:blue', linewidth=1, label='Close')
+    buyDates, buyPrices = series['buys']
+    sellDates, sellPrices = series['sells']
+    price.scatter(buyDates, buyPrices, marker='^', color='tab:green', s=12, label='Buy', zorder=3)
+    price.scatter(sellDates, sellPrices, marker='v', color='tab:red', s=12, label='Sell', zorder=3)
+    price.legend(loc='upper left')
+    price.set_ylabel('Price')
+    equity.plot(series['dates'], series['equity'], color='tab:purple', linewidth=1)
+    equity.set_ylabel('Value')
+    if title:
+        price.set_title(title)
+    figure.autofmt_xdate()
+    figure.tight_layout()
+    return figure
+
+def render_png(series:dict, title:str = None) -> bytes:
+    figure = render_figure(series, title)
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png', dpi=CHART_DPI)
+    return buffer.getvalue()
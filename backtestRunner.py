@@ -0,0 +1,158 @@
+# Runs backtests for the Backtester page
+#
+# run_strategies sends every selected strategy to a persistent pool of worker processes and
+# yields each result as soon as it finishes. The price data is copied once into shared memory
+# and the workers map it, so a task only pickles a strategy reference and a block name.
+# Built-in strategies travel as importable classes, uploaded ones as (name, source) specs
+# and only ever run in the sandbox pool.
+# Runs return performance metrics and downsampled chart series rather than matplotlib figures,
+# and every result is kept in the content-addressed result cache so an identical rerun never
+# reaches the pool.
+
+import os
+import multiprocessing
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import backtrader as bt
+from analytics import performance, returns, trade_returns
+from arrayFeed import ArrayData, datetimes
+from backtestCharts import EquityRecorder, chart_series
+from priceFeed import PriceArrays, attach_arrays, share_arrays
+from resultCache import get_result_cache, result_key
+from runProgress import ProgressChannel, ProgressReporter
+from strategySandbox import compiled_strategy, source_hash, submit_sandboxed
+
+PROGRESS_INTERVAL = 0.25
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool(maxWorkers:int = None) -> ProcessPoolExecutor:
+    """Process-wide worker pool, started once and reused by every session."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn keeps the workers free of the Streamlit server's threads and sockets
+            _pool = ProcessPoolExecutor(max_workers=maxWorkers or os.cpu_count(),
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def strategy_spec(strategy, source:str = None):
+    """Picklable reference to a strategy: the class itself if importable, else its source."""
+    if source is None:
+        return strategy
+    name = strategy if isinstance(strategy, str) else strategy.__name__
+    return {"name": name, "source": source, "hash": source_hash(source)}
+
+def strategy_name(spec) -> str:
+    return spec["name"] if isinstance(spec, dict) else spec.__name__
+
+def is_uploaded(spec) -> bool:
+    return isinstance(spec, dict)
+
+def resolve_strategy(spec):
+    if not is_uploaded(spec):
+        return spec
+    return compiled_strategy(spec)
+
+def submit(pool, function, spec_list:list, *args):
+    """Send work touching uploaded strategies to the sandbox pool, everything else to pool."""
+    if any(is_uploaded(spec) for spec in spec_list):
+        return submit_sandboxed(function, *args)
+    return pool.submit(function, *args)
+
+def run_strategy(strategy, data_feed, initial_cash, commission, chart:bool = True, progress:ProgressChannel = None):
+    cerebro = bt.Cerebro()
+    cerebro.adddata(data_feed)
+    cerebro.addstrategy(strategy)
+    cerebro.broker.set_cash(initial_cash)
+    cerebro.broker.setcommission(commission=commission)
+    cerebro.addanalyzer(EquityRecorder, _name='equity')
+    if progress is not None:
+        cerebro.addanalyzer(ProgressReporter, channel=progress, task=strategy.__name__)
+
+    starting_value = cerebro.broker.getvalue()
+    strat = cerebro.run()[0]
+    ending_value = cerebro.broker.getvalue()
+    recorded = strat.analyzers.equity.get_analysis()
+    metrics = performance(recorded['equity'], recorded['position'], recorded['close'], recorded['trades'],
+                          datetimes(recorded['dates']))
+    # only the downsampled series leave the run, figures are drawn later on demand
+    series = chart_series(recorded) if chart else None
+
+    return {
+        'Strategy': strategy.__name__,
+        'Starting Value': starting_value,
+        'Ending Value': ending_value,
+        **metrics
+    }, {'series':series,
+        'name':strategy.__name__,
+        # per-bar and per-trade returns are what Monte Carlo resamples
+        'returns':returns(recorded['equity']),
+        'trades':trade_returns(recorded['equity'], recorded['position'])}
+
+def _run_shared(spec, descriptor, initial_cash, commission, chart, progress):
+    block, arrays = attach_arrays(descriptor)
+    try:
+        data_feed = ArrayData(arrays=arrays)
+        del arrays
+        return run_strategy(resolve_strategy(spec), data_feed, initial_cash, commission, chart, progress)
+    finally:
+        block.close()
+
+def run_strategies(specs:list, arrays:PriceArrays, initial_cash, commission, chart:bool = True, maxWorkers:int = None,
+                   useCache:bool = True, progress:ProgressChannel = None, onProgress = None):
+    """Yield (result, chart) per strategy in completion order; a failed run yields an Error entry.
+
+    With a progress channel, onProgress is called with the reporters' events while the runs are
+    going. Closing the generator early (a Streamlit rerun or stop) cancels the remaining runs.
+    """
+    cache = get_result_cache() if useCache else None
+    pending = []
+    if cache is not None:
+        digest = arrays.digest()
+        for spec in specs:
+            key = result_key(spec, digest, initial_cash, commission, chart=chart)
+            cached = cache.get(key)
+            if cached is not None:
+                yield cached
+            else:
+                pending.append((spec, key))
+    else:
+        pending = [(spec, None) for spec in specs]
+    if not pending:
+        return
+
+    block, descriptor = share_arrays(arrays)
+    futures = {}
+    try:
+        pool = get_pool(maxWorkers)
+        futures = {submit(pool, _run_shared, [spec], spec, descriptor, initial_cash, commission, chart, progress): (spec, key)
+                   for spec, key in pending}
+        remaining = set(futures)
+        while remaining:
+            done, remaining = wait(remaining, timeout=None if progress is None else PROGRESS_INTERVAL,
+                                   return_when=FIRST_COMPLETED)
+            if progress is not None and onProgress is not None:
+                events = progress.drain()
+                if events:
+                    onProgress(events)
+            for future in done:
+                spec, key = futures[future]
+                name = strategy_name(spec)
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    yield {'Strategy': name, 'Error': str(e)}, {'series': None, 'name': name}
+                    continue
+                if cache is not None:
+                    cache.put(key, outcome)
+                yield outcome
+    finally:
+        # stops runs still in the workers at their next progress report, drops queued ones
+        if progress is not None:
+            progress.cancel()
+        for future in futures:
+            future.cancel()
+        block.close()
+        block.unlink()
@@ -0,0 +1,137 @@
+# Batch backtests of the selected strategies over a whole universe of tickers
+#
+# A universe is either one of the ticker lists in data/tickerList or every history scraped
+# for a country under data/scrapedData. Tickers are handed to the shared worker pool in small
+# chunks; each worker loads its own prices, runs every strategy and sends back one compact row
+# per (ticker, strategy) with its performance metrics. Built-in strategies use the vectorized
+# engine, uploaded ones run through backtrader with an EquityRecorder, in the sandbox pool.
+
+import os
+import glob
+from concurrent.futures import as_completed
+import pandas as pd
+import backtrader as bt
+from analytics import performance
+from arrayFeed import ArrayData
+from backtestCharts import EquityRecorder
+from backtestRunner import get_pool, resolve_strategy, strategy_name, submit
+from cleanData import clean_history, clean_prices
+from dataStore import SCRAPED_ROOT, get_store
+from marketData import COUNTRY_TIMEZONES
+from priceFeed import PriceArrays
+from pricePanel import current_panel
+from runProgress import ProgressChannel
+import vectorBacktest
+
+TICKER_LIST_ROOT = "data/tickerList"
+CHUNK_SIZE = 8
+
+def universe_sources(backend:str = None, root:str = SCRAPED_ROOT, tickerListRoot:str = TICKER_LIST_ROOT) -> list:
+    """Universe names: 'list:<file>' for ticker lists, 'scraped:<country>' for scraped histories."""
+    sources = [f"list:{os.path.basename(path)}" for path in sorted(glob.glob(os.path.join(tickerListRoot, "*.csv")))]
+    if os.path.isdir(root):
+        store = get_store(backend, root)
+        # a country only counts once it has histories in the configured backend
+        sources += [f"scraped:{country}" for country in sorted(os.listdir(root))
+                    if os.path.isdir(os.path.join(root, country)) and store.list_tickers(country)]
+    return sources
+
+def load_universe(source:str, backend:str = None, root:str = SCRAPED_ROOT, tickerListRoot:str = TICKER_LIST_ROOT) -> list:
+    """(ticker, country) pairs of a universe; country is None when prices come from the provider."""
+    kind, _, name = source.partition(":")
+    if kind == "list":
+        tickers = pd.read_csv(os.path.join(tickerListRoot, name), usecols=["Ticker"], dtype=str)["Ticker"].dropna()
+        return [(ticker, None) for ticker in tickers.drop_duplicates()]
+    if kind == "scraped":
+        return [(ticker, name) for ticker in get_store(backend, root).list_tickers(name)]
+    raise ValueError(f"Unknown universe {source}")
+
+def load_prices(ticker:str, country:str, start = None, end = None, backend:str = None, root:str = SCRAPED_ROOT) -> pd.DataFrame:
+    if country is None:
+        return clean_history(ticker, start=start, end=end)
+    # a current panel serves the same bars from shared memory instead of parsing the file
+    panel = current_panel(country, backend, root)
+    if panel is not None and ticker in panel:
+        raw = panel.frame(ticker, start, end)
+    else:
+        raw = get_store(backend, root).read(ticker, country, start=start, end=end)
+    if raw.empty:
+        return raw
+    return clean_prices(raw, COUNTRY_TIMEZONES.get(country))[0]
+
+def equity_curve(strategy, arrays:PriceArrays, initial_cash, commission) -> dict:
+    """Per-bar equity and position of one run; backtrader runs also give closed-trade profits."""
+    if vectorBacktest.supports(strategy):
+        curves = vectorBacktest.run_vectorized(strategy, arrays, initial_cash, commission)[1]
+        return {'equity': curves['equity'], 'position': curves['position'], 'close': arrays.close, 'trades': None}
+    cerebro = bt.Cerebro()
+    cerebro.adddata(ArrayData(arrays=arrays))
+    cerebro.addstrategy(strategy)
+    cerebro.broker.set_cash(initial_cash)
+    cerebro.broker.setcommission(commission=commission)
+    cerebro.addanalyzer(EquityRecorder, _name='equity')
+    return cerebro.run()[0].analyzers.equity.get_analysis()
+
+def _run_tickers(tickers:list, specs:list, start, end, initial_cash, commission, backend:str, root:str,
+                 progress:ProgressChannel = None) -> list:
+    strategies = [(strategy_name(spec), resolve_strategy(spec)) for spec in specs]
+    rows = []
+    for ticker, country in tickers:
+        if progress is not None and progress.is_cancelled():
+            break
+        try:
+            data = load_prices(ticker, country, start, end, backend, root)
+        except Exception as e:
+            rows.append({'Ticker': ticker, 'Error': str(e)})
+            continue
+        if data.empty:
+            rows.append({'Ticker': ticker, 'Error': 'No data'})
+            continue
+        arrays = PriceArrays.from_frame(data)
+        for name, strategy in strategies:
+            try:
+                curves = equity_curve(strategy, arrays, initial_cash, commission)
+            except Exception as e:
+                rows.append({'Ticker': ticker, 'Strategy': name, 'Error': str(e)})
+                continue
+            equity = curves['equity']
+            ending = float(equity[-1]) if len(equity) else float(initial_cash)
+            rows.append({
+                'Ticker': ticker,
+                'Strategy': name,
+                'Bars': len(arrays),
+                'Ending Value': ending,
+                **performance(equity, curves['position'], curves['close'], curves['trades'], arrays.dates),
+            })
+    return rows
+
+def run_universe(tickers:list, specs:list, initial_cash, commission, start = None, end = None,
+                 chunkSize:int = CHUNK_SIZE, maxWorkers:int = None, backend:str = None, root:str = SCRAPED_ROOT,
+                 progress:ProgressChannel = None):
+    """Yield (rows, tickersDone) as each chunk of tickers finishes, in completion order.
+
+    Closing the generator early cancels queued chunks and, with a progress channel, makes
+    running chunks stop at their next ticker.
+    """
+    pool = get_pool(maxWorkers)
+    futures = {}
+    for i in range(0, len(tickers), chunkSize):
+        chunk = tickers[i:i + chunkSize]
+        futures[submit(pool, _run_tickers, specs, chunk, specs, start, end, initial_cash, commission, backend, root,
+                       progress)] = chunk
+    done = 0
+    try:
+        for future in as_completed(futures):
+            chunk = futures[future]
+            done += len(chunk)
+            try:
+                rows = future.result()
+            except Exception as e:
+                rows = [{'Ticker': ticker, 'Error': str(e)} for ticker, _ in chunk]
+            yield rows, done
+    finally:
+        # a consumer that stops early (page rerun) should not leave thousands of queued chunks behind
+        if progress is not None:
+            progress.cancel()
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,271 @@
+# Throughput benchmarks for the backtester and the optimizer
+#
+# Every case runs in a fresh spawned process so its peak RSS is its own, and reports wall time,
+# bars per second and the time spent in each phase: load (store read and cleaning, or synthetic
+# generation), feed (building the data feed or arrays), run and plot. Cases cover the four
+# built-in strategies on the bundled data/scrapedData histories, synthetic histories scaled to
+# 10x and 100x their bars, a synthetic universe of 1000 tickers and the GeneticAlgo grid, run
+# through optimizer.grid_search and, as the baseline it replaced, backtrader's optstrategy,
+# and the page's largest grid on the whole history, in full and by successive halving.
+# Results print as JSON so runs from different releases can be diffed.
+#
+#   python benchmark.py --output bench.json
+#   python benchmark.py --quick
+
+import os
+import sys
+import itertools
+import json
+import time
+import platform
+import argparse
+import resource
+import subprocess
+import multiprocessing
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import backtrader as bt
+import strategies
+from arrayFeed import ArrayData
+from backtestCharts import EquityRecorder, chart_series, render_png
+from cleanData import clean_prices
+from dataStore import get_store
+from marketData import COUNTRY_TIMEZONES
+from optimizer import grid_search, successive_halving
+from priceFeed import PriceArrays
+from vectorBacktest import run_vectorized
+
+BUNDLED = [("AAPL", "US"), ("MSFT", "US"), ("NVDA", "US"), ("BHARTIARTL.NS", "IND")]
+STRATEGY_NAMES = ["MovingAverageCrossover", "RSIStrategy", "BollingerBandsStrategy", "MACDStrategy"]
+
+def synthetic_prices(bars:int, seed:int = 0) -> pd.DataFrame:
+    """Seeded random-walk OHLCV on a minute clock, any length fits in the timestamp range."""
+    rng = np.random.default_rng(seed)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, bars)))
+    open_ = np.concatenate([[100.0], close[:-1]]) * np.exp(rng.normal(0.0, 0.002, bars))
+    spread = np.abs(rng.normal(0.0, 0.005, bars))
+    return pd.DataFrame({
+        "Open": open_,
+        "High": np.maximum(open_, close) * (1.0 + spread),
+        "Low": np.minimum(open_, close) * (1.0 - spread),
+        "Close": close,
+        "Volume": rng.integers(1_000, 1_000_000, bars).astype(np.float64),
+    }, index=pd.date_range("2000-01-03", periods=bars, freq="min", name="Date"))
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _load(source):
+    """source is (ticker, country) for bundled data or ('synthetic', bars, seed)."""
+    if source[0] == "synthetic":
+        return synthetic_prices(source[1], source[2])
+    ticker, country = source
+    return clean_prices(get_store().read(ticker, country), COUNTRY_TIMEZONES.get(country))[0]
+
+def _backtrader_case(source, strategyName, initial_cash, commission, plot):
+    phases = {}
+    start = time.perf_counter()
+    data = _load(source)
+    phases["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # the Backtester's path: arrays from the worker's shared block preloaded by ArrayData
+    feed = ArrayData(arrays=PriceArrays.from_frame(data))
+    cerebro = bt.Cerebro()
+    cerebro.adddata(feed)
+    cerebro.addstrategy(getattr(strategies, strategyName))
+    cerebro.broker.set_cash(initial_cash)
+    cerebro.broker.setcommission(commission=commission)
+    cerebro.addanalyzer(EquityRecorder, _name="equity")
+    phases["feed"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    strat = cerebro.run()[0]
+    phases["run"] = time.perf_counter() - start
+
+    if plot:
+        start = time.perf_counter()
+        render_png(chart_series(strat.analyzers.equity.get_analysis()), strategyName)
+        phases["plot"] = time.perf_counter() - start
+    return len(data), phases, {"endingValue": cerebro.broker.getvalue()}
+
+def _vector_case(sources, strategyName, initial_cash, commission):
+    phases = {"load": 0.0, "feed": 0.0, "run": 0.0}
+    bars = 0
+    endingValues = []
+    for source in sources:
+        start = time.perf_counter()
+        data = _load(source)
+        phases["load"] += time.perf_counter() - start
+        start = time.perf_counter()
+        arrays = PriceArrays.from_frame(data)
+        phases["feed"] += time.perf_counter() - start
+        start = time.perf_counter()
+        result, _ = run_vectorized(getattr(strategies, strategyName), arrays, initial_cash, commission)
+        phases["run"] += time.perf_counter() - start
+        bars += len(arrays)
+        endingValues.append(result["Ending Value"])
+    return bars, phases, {"tickers": len(sources), "meanEndingValue": float(np.mean(endingValues))}
+
+def _grid_case(source, gridBars, shortRange, longRange, initial_cash, commission, search:str = "grid"):
+    # search "grid" is optimizer.grid_search, what optimize_strategy in prototypes/GeneticAlgo.py
+    # runs; "halving" is the page's successive halving mode; "optstrategy" is backtrader's own
+    # optimizer, the baseline grid_search replaced
+    phases = {}
+    start = time.perf_counter()
+    data = _load(source)
+    if gridBars:
+        data = data.iloc[-gridBars:]
+    phases["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    arrays = PriceArrays.from_frame(data)
+    grid = {"short_period": range(*shortRange), "long_period": range(*longRange)}
+    if search == "optstrategy":
+        cerebro = bt.Cerebro(optreturn=False, maxcpus=1)
+        cerebro.adddata(ArrayData(arrays=arrays))
+        cerebro.optstrategy(strategies.MovingAverageCrossover, **grid)
+        cerebro.broker.set_cash(initial_cash)
+        cerebro.broker.setcommission(commission=commission)
+    phases["feed"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    extra = {}
+    if search == "optstrategy":
+        # the runs share one broker, its value is only the last run's
+        combinations = len(cerebro.run())
+    elif search == "halving":
+        points = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+        with closing(successive_halving(strategies.MovingAverageCrossover, arrays, points, initial_cash,
+                                        commission)) as rungs:
+            for rung, bars, records in rungs:
+                extra[f"rung{rung}"] = {"bars": bars, "combinations": len(records)}
+        combinations = len(points)
+        extra["bestEndingValue"] = float(records[0]["Ending Value"])
+    else:
+        endingValues = [record["Ending Value"] for records, _ in
+                        grid_search(strategies.MovingAverageCrossover, arrays, grid, initial_cash, commission)
+                        for record in records]
+        combinations = len(endingValues)
+        extra["bestEndingValue"] = float(max(endingValues))
+    phases["run"] = time.perf_counter() - start
+    # bars/second counts every bar of every combination, for halving as if it had run them all
+    return len(data) * combinations, phases, {"combinations": combinations, "barsPerRun": len(data), **extra}
+
+CASES = {"backtrader": _backtrader_case, "vector": _vector_case, "grid": _grid_case}
+
+def _measure(kind, name, args):
+    start = time.perf_counter()
+    bars, phases, extra = CASES[kind](*args)
+    wall = time.perf_counter() - start
+    return {
+        "name": name,
+        "kind": kind,
+        "bars": bars,
+        "wallSeconds": wall,
+        "barsPerSecond": bars / wall if wall > 0 else None,
+        "phases": phases,
+        "peakRssMb": _peak_rss_mb(),
+        **extra,
+    }
+
+def run_case(kind, name, args, isolated:bool = True) -> dict:
+    if not isolated:
+        return _measure(kind, name, args)
+    # one fresh interpreter per case, otherwise peak RSS would be the maximum over every earlier case
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_measure, kind, name, args).result()
+
+def plan_cases(quick:bool = False, scales = (10, 100), universe:int = 1000, backtraderMaxBars:int = 100_000,
+               initial_cash = 10000, commission = 0.001) -> list:
+    cases = []
+    bundled = BUNDLED[:1] if quick else BUNDLED
+    for ticker, country in bundled:
+        for strategyName in STRATEGY_NAMES:
+            cases.append(("backtrader", f"backtrader/{ticker}/{strategyName}",
+                          ((ticker, country), strategyName, initial_cash, commission, True)))
+            cases.append(("vector", f"vector/{ticker}/{strategyName}",
+                          ([(ticker, country)], strategyName, initial_cash, commission)))
+
+    baseBars = len(_load(BUNDLED[0]))
+    for scale in ((10,) if quick else scales):
+        bars = baseBars * scale
+        for strategyName in STRATEGY_NAMES:
+            source = ("synthetic", bars, scale)
+            # backtrader at 100x takes minutes per strategy, so large scales run vectorized only
+            if bars <= backtraderMaxBars:
+                cases.append(("backtrader", f"backtrader/synthetic-{scale}x/{strategyName}",
+                              (source, strategyName, initial_cash, commission, True)))
+            cases.append(("vector", f"vector/synthetic-{scale}x/{strategyName}",
+                          ([source], strategyName, initial_cash, commission)))
+
+    tickers = 50 if quick else universe
+    for strategyName in STRATEGY_NAMES:
+        sources = [("synthetic", 2520, seed) for seed in range(tickers)]
+        cases.append(("vector", f"vector/universe-{tickers}/{strategyName}",
+                      (sources, strategyName, initial_cash, commission)))
+
+    shortRange, longRange = ((10, 15), (50, 55)) if quick else ((10, 31), (50, 71))
+    cases.append(("grid", "grid/AAPL/MovingAverageCrossover",
+                  (BUNDLED[0], 252, shortRange, longRange, initial_cash, commission)))
+    cases.append(("grid", "grid/AAPL/MovingAverageCrossover/optstrategy-baseline",
+                  (BUNDLED[0], 252, shortRange, longRange, initial_cash, commission, "optstrategy")))
+    # the Optimizer page's slider limits
+    shortRange, longRange = ((5, 21), (20, 51)) if quick else ((5, 51), (20, 101))
+    for search in ("grid", "halving"):
+        cases.append(("grid", f"grid/AAPL-history/MovingAverageCrossover/{search}",
+                      (BUNDLED[0], None, shortRange, longRange, initial_cash, commission, search)))
+    return cases
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(quick:bool = False, isolated:bool = True, only:str = None, **options) -> dict:
+    cases = [case for case in plan_cases(quick, **options) if only is None or only in case[1]]
+    results = []
+    for kind, name, args in cases:
+        result = run_case(kind, name, args, isolated)
+        print(f"{name}: {result['wallSeconds']:.3f}s, {result['barsPerSecond']:,.0f} bars/s", file=sys.stderr)
+        results.append(result)
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpuCount": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "backtrader": bt.__version__,
+            "quick": quick,
+        },
+        "cases": results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest throughput benchmarks")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--quick", action="store_true", help="one bundled ticker, 10x scale, small universe and grid")
+    parser.add_argument("--only", help="run only cases whose name contains this text")
+    parser.add_argument("--in-process", action="store_true", help="run cases in this process (peak RSS becomes cumulative)")
+    parser.add_argument("--universe", type=int, default=1000, help="synthetic tickers in the universe case")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.quick, not args.in_process, args.only, universe=args.universe)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# Cleaning and corporate-action stage between the data provider and the pages
+#
+# clean_prices normalizes a history to exchange-local session dates, drops duplicated bars,
+# reindexes onto a business-day calendar and forward-fills short gaps according to a
+# CleaningPolicy. adjustment_factors turns the Dividends / Stock Splits columns into
+# back-adjustment factors with one reverse cumulative product, for one ticker (1-D) or a
+# whole dates x tickers panel (2-D) at once; adjust_prices applies them when the policy
+# asks for it. clean_history caches the cleaned output.
+
+import threading
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from cachetools import TTLCache
+from marketData import COUNTRY_TIMEZONES, get_provider
+
+PRICE_FIELDS = ["Open", "High", "Low", "Close"]
+
+# fillLimit: longest run of missing sessions that is forward-filled, 0 disables filling
+# calendar: "observed" keeps the dates present, "business" reindexes onto every weekday (holidays included)
+# dropEmpty: drop calendar rows that are still missing after filling
+# adjust: back-adjust for splits and dividends, only for raw histories (yfinance's come adjusted)
+CleaningPolicy = namedtuple("CleaningPolicy", ["fillLimit", "calendar", "dropEmpty", "adjust"],
+                            defaults=[5, "observed", True, False])
+DEFAULT_POLICY = CleaningPolicy()
+
+_cleaned = TTLCache(maxsize=256, ttl=900)
+_cleaned_lock = threading.Lock()
+
+def normalize_timezone(data:pd.DataFrame, timezone:str = None) -> pd.DataFrame:
+    """Key daily bars by their exchange-local session date, without a timezone."""
+    index = pd.DatetimeIndex(data.index)
+    if index.tz is not None:
+        if timezone is not None:
+            index = index.tz_convert(timezone)
+        index = index.tz_localize(None)
+    data = data.copy()
+    data.index = pd.DatetimeIndex(index.normalize(), name="Date")
+    return data.sort_index(kind="stable")
+
+def find_gaps(index:pd.DatetimeIndex) -> pd.DataFrame:
+    """Runs of missing business days between consecutive bars."""
+    if len(index) < 2:
+        return pd.DataFrame(columns=["After", "Before", "Missing"])
+    dates = index.values.astype("datetime64[D]")
+    missing = np.busday_count(dates[:-1], dates[1:]) - 1
+    gaps = np.flatnonzero(missing > 0)
+    return pd.DataFrame({"After": index[gaps], "Before": index[gaps + 1], "Missing": missing[gaps]})
+
+def clean_prices(data:pd.DataFrame, timezone:str = None, policy:CleaningPolicy = DEFAULT_POLICY):
+    """Return the cleaned frame and a report of what was changed."""
+    data = normalize_timezone(data, timezone)
+    duplicated = data.index.duplicated(keep="last")
+    data = data[~duplicated]
+    gaps = find_gaps(data.index)
+
+    if policy.calendar == "business" and len(data):
+        calendar = pd.bdate_range(data.index[0], data.index[-1], name="Date")
+        data = data.reindex(calendar.union(data.index))
+
+    filledRows = 0
+    if policy.fillLimit and "Close" in data.columns:
+        missing = data["Close"].isna()
+        close = data["Close"].ffill(limit=policy.fillLimit)
+        filled = missing & close.notna()
+        data["Close"] = close
+        # a filled bar is a flat bar at the last close, with no volume and no corporate action
+        for column in ("Open", "High", "Low"):
+            if column in data.columns:
+                data.loc[filled, column] = close[filled]
+        for column in ("Volume", "Dividends", "Stock Splits"):
+            if column in data.columns:
+                data.loc[filled, column] = 0
+        filledRows = int(filled.sum())
+
+    droppedRows = 0
+    if policy.dropEmpty:
+        empty = data["Close"].isna()
+        droppedRows = int(empty.sum())
+        data = data[~empty]
+
+    if policy.adjust and len(data):
+        data = adjust_prices(data)
+
+    report = {
+        "duplicates": int(duplicated.sum()),
+        "gaps": len(gaps),
+        "longestGap": int(gaps["Missing"].max()) if len(gaps) else 0,
+        "filled": filledRows,
+        "dropped": droppedRows,
+    }
+    return data, report
+
+def adjustment_factors(close, dividends = None, splits = None) -> np.ndarray:
+    """Back-adjustment factors for raw prices, same shape as close.
+
+    Works on a 1-D history or a 2-D dates x tickers array. The factor of a bar is the product
+    of every later event: 1 / ratio for a split and 1 - dividend / previous close for a dividend.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    events = np.ones_like(close)
+    if splits is not None:
+        splits = np.nan_to_num(np.asarray(splits, dtype=np.float64))
+        events = np.where(splits > 0, 1.0 / np.where(splits > 0, splits, 1.0), events)
+    if dividends is not None:
+        dividends = np.nan_to_num(np.asarray(dividends, dtype=np.float64))
+        previousClose = np.roll(close, 1, axis=0)
+        previousClose[0] = np.nan
+        dividendFactor = 1.0 - dividends / previousClose
+        events = events * np.where((dividends > 0) & np.isfinite(dividendFactor), dividendFactor, 1.0)
+    # an event on bar t adjusts bars before t, so shift by one and take the reverse cumulative product
+    shifted = np.ones_like(events)
+    shifted[:-1] = events[1:]
+    return np.cumprod(shifted[::-1], axis=0)[::-1]
+
+def adjust_prices(data:pd.DataFrame) -> pd.DataFrame:
+    """Apply split/dividend back-adjustment to a raw (unadjusted) OHLCV history."""
+    factors = adjustment_factors(data["Close"], data.get("Dividends"), data.get("Stock Splits"))
+    adjusted = data.copy()
+    for column in PRICE_FIELDS:
+        if column in adjusted.columns:
+            adjusted[column] = adjusted[column].to_numpy() * factors
+    if "Volume" in adjusted.columns:
+        splitFactors = adjustment_factors(data["Close"], None, data.get("Stock Splits"))
+        adjusted["Volume"] = adjusted["Volume"].to_numpy() / splitFactors
+    return adjusted
+
+def align_closes(closes:dict, policy:CleaningPolicy = DEFAULT_POLICY) -> pd.DataFrame:
+    """Wide frame of close series on one calendar, short gaps filled per policy."""
+    wide = pd.DataFrame(closes)
+    if wide.empty:
+        return wide
+    wide = wide.sort_index()
+    if policy.fillLimit:
+        wide = wide.ffill(limit=policy.fillLimit)
+    if policy.dropEmpty:
+        wide = wide.dropna()
+    return wide
+
+def clean_history(ticker:str, start = None, end = None, period:str = None, policy:CleaningPolicy = DEFAULT_POLICY) -> pd.DataFrame:
+    """Cleaned daily history from the shared provider, cached across reruns and sessions."""
+    key = (ticker, str(start), str(end), period, policy)
+    # every caller gets its own copy, the cached frame is shared by all sessions
+    with _cleaned_lock:
+        if key in _cleaned:
+            return _cleaned[key].copy()
+    provider = get_provider()
+    raw = provider.history(ticker, start=start, end=end, period=period)
+    if raw.empty:
+        cleaned = raw
+    else:
+        cleaned, _ = clean_prices(raw, COUNTRY_TIMEZONES.get(provider.local_country(ticker)), policy)
+    with _cleaned_lock:
+        _cleaned[key] = cleaned
+    return cleaned.copy()
@@ -3,54 +3,186 @@
 import yfinance as yf
 import sys
 import os
+import json
+import time
+import random
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
+from dataStore import get_store
+
+MANIFEST_NAME = "_manifest.json"
+
+class RateLimiter:
+    """Thread-safe limiter that spaces calls to at most requestsPerSecond."""
+    def __init__(self, requestsPerSecond:float = 2.0):
+        self.interval = 1.0 / requestsPerSecond if requestsPerSecond and requestsPerSecond > 0 else 0.0
+        self._nextSlot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if self.interval == 0.0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            waitFor = self._nextSlot - now
+            self._nextSlot = max(now, self._nextSlot) + self.interval
+        if waitFor > 0:
+            time.sleep(waitFor)
 
 class dataScraper:
-    def __init__(self):
-        return
-    
+    def __init__(self,storage:str = None):
+        self.store = get_store(storage)
+
     def download_data(self,companyName:str, countryName:str,startDate:str = "2000-01-01",endDate:str = "2024-12-31") -> str:
         stock = yf.Ticker(companyName)
         data = stock.history(start = startDate, end = endDate)
-        
+
         if(data.empty):
             return f"No data found for {companyName}"
-        
-        data.to_csv(f"data/scrapedData/{countryName}/{companyName}.csv")
+
+        self.store.write(companyName, countryName, data)
         del data,stock
-        return f"Downloaded data for {companyName}" 
-        
-        
-    def bulk_download_data(self,countryName:str = None,tickerListPath:str = None,requiredNumber:int = None,startDate:str = "2000-01-01",endDate:str = "2024-12-31") -> str:
+        return f"Downloaded data for {companyName}"
+
+    def update_data(self,companyName:str, countryName:str,startDate:str = "2000-01-01",endDate:str = None,overlap:int = 5,tolerance:float = 1e-4) -> str:
+        if not self.store.exists(companyName, countryName):
+            return self.download_data(companyName, countryName, startDate, endDate)
+
+        stored = self.store.last_bars(companyName, countryName, overlap)
+        if stored.empty:
+            return self.download_data(companyName, countryName, startDate, endDate)
+
+        # re-fetch a few stored bars as well, they are used to detect re-adjusted history
+        fetchStart = stored.index[0].date().isoformat()
+        stock = yf.Ticker(companyName)
+        fresh = stock.history(start = fetchStart, end = endDate)
+        if(fresh.empty):
+            return f"No new data for {companyName}"
+
+        freshUtc = fresh.copy()
+        freshUtc.index = freshUtc.index.tz_convert("UTC") if freshUtc.index.tz is not None else freshUtc.index.tz_localize("UTC")
+        common = stored.index.intersection(freshUtc.index)
+        newBars = fresh[freshUtc.index > stored.index[-1]]
+
+        # yfinance back-adjusts prices for splits and dividends, so any corporate action shows up
+        # either as a non-zero event in the new bars or as drift in the overlapping closes
+        adjusted = len(common) == 0
+        if not adjusted:
+            old = stored.loc[common, "Close"].to_numpy()
+            new = freshUtc.loc[common, "Close"].to_numpy()
+            adjusted = bool(abs(new - old).max() > tolerance * abs(old).max())
+        for column in ("Dividends", "Stock Splits"):
+            if column in newBars.columns and (newBars[column].fillna(0) != 0).any():
+                adjusted = True
+        if adjusted:
+            self.download_data(companyName, countryName, startDate, endDate)
+            return f"Rewrote data for {companyName} after a corporate action"
+
+        if(newBars.empty):
+            return f"Data for {companyName} is up to date"
+
+        self.store.append(companyName, countryName, newBars)
+        return f"Appended {len(newBars)} bars for {companyName}"
+
+    def _load_manifest(self,manifestPath:str) -> dict:
+        if not os.path.exists(manifestPath):
+            return {}
+        try:
+            with open(manifestPath) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self,manifestPath:str,manifest:dict):
+        # write to a temp file first so an interrupted run never leaves a truncated manifest
+        tmpPath = manifestPath + ".tmp"
+        with open(tmpPath, "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmpPath, manifestPath)
+
+    def _fetch_with_retry(self,ticker:str,countryName:str,startDate:str,endDate:str,limiter:RateLimiter,maxRetries:int,backoff:float,incremental:bool = False) -> dict:
+        fetch = self.update_data if incremental else self.download_data
+        attempts = 0
+        while True:
+            attempts += 1
+            limiter.wait()
+            try:
+                message = fetch(ticker, countryName, startDate, endDate)
+                status = "empty" if message.startswith("No data found") else "done"
+                return {"status": status, "attempts": attempts, "error": None}
+            except Exception as e:
+                if attempts > maxRetries:
+                    return {"status": "failed", "attempts": attempts, "error": str(e)}
+                # exponential backoff with jitter so retrying workers do not hit the API in lockstep
+                time.sleep(backoff * (2 ** (attempts - 1)) * (1 + random.random()))
+
+    def bulk_download_data(self,countryName:str = None,tickerListPath:str = None,requiredNumber:int = None,startDate:str = "2000-01-01",endDate:str = None,
+                           maxWorkers:int = 8,requestsPerSecond:float = 4.0,maxRetries:int = 3,backoff:float = 1.0,resume:bool = True,manifestPath:str = None,
+                           incremental:bool = False) -> str:
         if(countryName == None):
             return f"Please give country code\n"
         elif(tickerListPath == None):
             return f"Please give a path to ticker list\n"
         elif not os.path.exists(tickerListPath):
             return f"File does not exist at {tickerListPath}\n"
-        
+
+        # an incremental refresh runs up to today, a full download keeps the fixed end it always had
+        if endDate is None and not incremental:
+            endDate = "2024-12-31"
+
         ticker_symbols = pd.read_csv(tickerListPath)
-        
-        if(requiredNumber == None):
-            ticker_symbols = ticker_symbols.head(5)
-        else:
+
+        if(requiredNumber != None):
             ticker_symbols = ticker_symbols.head(requiredNumber)
-        
-        for ticker in ticker_symbols['Ticker']:
-            stock = yf.Ticker(ticker)
-            data = stock.history(start = startDate, end = endDate)
-            
-            if(data.empty):
-                return f"No data found for {ticker}"
-            
-            data.to_csv(f"data/scrapedData/{countryName}/{ticker}.csv")
-            del data,stock
-            return f"Downloaded data for {ticker}"
-        
+        tickers = ticker_symbols['Ticker'].dropna().astype(str).drop_duplicates().tolist()
+
+        os.makedirs(os.path.join(self.store.root, countryName), exist_ok=True)
+        if(manifestPath == None):
+            manifestPath = os.path.join(self.store.root, countryName, MANIFEST_NAME)
+        manifest = self._load_manifest(manifestPath) if resume else {}
+        # only an unfinished run of the same kind is resumed, a finished one is started over
+        run = manifest.get("_run", {})
+        if "finished" in run or run.get("incremental") != incremental:
+            manifest = {"_run": {"started": datetime.now().isoformat(timespec="seconds"), "incremental": incremental}}
+
+        # "empty" tickers are delisted/unknown symbols, retrying them on resume only burns rate limit
+        pending = [ticker for ticker in tickers if manifest.get(ticker, {}).get("status") not in ("done", "empty")]
+        skipped = len(tickers) - len(pending)
+
+        limiter = RateLimiter(requestsPerSecond)
+        lock = threading.Lock()
+        completed = 0
+        with ThreadPoolExecutor(max_workers=maxWorkers) as pool:
+            futures = {pool.submit(self._fetch_with_retry, ticker, countryName, startDate, endDate, limiter, maxRetries, backoff, incremental): ticker for ticker in pending}
+            for future in as_completed(futures):
+                ticker = futures[future]
+                record = future.result()
+                record["updated"] = datetime.now().isoformat(timespec="seconds")
+                with lock:
+                    manifest[ticker] = record
+                    completed += 1
+                    # checkpoint regularly so a killed run can resume close to where it stopped
+                    if completed % 25 == 0:
+                        self._save_manifest(manifestPath, manifest)
+        manifest["_run"]["finished"] = datetime.now().isoformat(timespec="seconds")
+        self._save_manifest(manifestPath, manifest)
+
+        counts = {"done": 0, "empty": 0, "failed": 0}
+        for ticker in tickers:
+            status = manifest.get(ticker, {}).get("status")
+            if status in counts:
+                counts[status] += 1
+        return (f"Downloaded {counts['done']} of {len(tickers)} tickers for {countryName} "
+                f"({counts['empty']} without data, {counts['failed']} failed, {skipped} skipped from manifest)")
+
 
 def main():
-    downloader = dataScraper
+    downloader = dataScraper()
     downloader.download_data("NVDA","US")
     #downloader.bulk_download_data(countryName = "IND",tickerListPath = "data/tickerList/indian_companies.csv")
-    
-main()
\ No newline at end of file
+    #downloader.bulk_download_data(countryName = "US",tickerListPath = "data/tickerList/us_companies.csv",incremental = True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# Storage backends for the scraped price histories in data/scrapedData
+#
+# Every backend keeps one file per ticker under data/scrapedData/<country>/ and hands back
+# DataFrames indexed by a UTC DatetimeIndex named "Date". The columnar backends store that
+# index as an int64 nanosecond column, so reads skip timestamp string parsing entirely.
+# QUANTQUIPS_STORE picks the backend every reader and writer uses; set it once the
+# histories have been converted with convert_csv_store.
+
+import os
+import io
+import glob
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.feather as feather
+
+SCRAPED_ROOT = "data/scrapedData"
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Volume", "Dividends", "Stock Splits"]
+STORE_BACKEND = os.environ.get("QUANTQUIPS_STORE", "csv")
+
+def _utc_index(index) -> pd.DatetimeIndex:
+    index = pd.DatetimeIndex(pd.to_datetime(index, utc=True)).as_unit("ns")
+    index.name = "Date"
+    return index
+
+def _to_columnar(data:pd.DataFrame) -> pd.DataFrame:
+    frame = data.reset_index(drop=True)
+    frame.insert(0, "Date", _utc_index(data.index).asi8)
+    if "Volume" in frame.columns:
+        frame["Volume"] = frame["Volume"].fillna(0).astype("int64")
+    return frame
+
+def _from_columnar(frame:pd.DataFrame) -> pd.DataFrame:
+    frame.index = pd.DatetimeIndex(pd.to_datetime(frame.pop("Date").to_numpy(dtype="int64"), utc=True), name="Date")
+    return frame
+
+def _date_bound(value) -> int:
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize("UTC")
+    return int(timestamp.tz_convert("UTC").value)
+
+def _slice_dates(data:pd.DataFrame, start, end) -> pd.DataFrame:
+    if start is not None:
+        data = data[data.index >= pd.Timestamp(_date_bound(start), tz="UTC")]
+    if end is not None:
+        data = data[data.index < pd.Timestamp(_date_bound(end), tz="UTC")]
+    return data
+
+class CsvStore:
+    """The original layout: one CSV per ticker with tz-offset timestamp strings."""
+    extension = "csv"
+
+    def __init__(self, root:str = SCRAPED_ROOT):
+        self.root = root
+
+    def path(self, ticker:str, countryName:str) -> str:
+        return os.path.join(self.root, countryName, f"{ticker}.{self.extension}")
+
+    def exists(self, ticker:str, countryName:str) -> bool:
+        path = self.path(ticker, countryName)
+        return os.path.exists(path) and os.path.getsize(path) > 0
+
+    def list_tickers(self, countryName:str) -> list:
+        suffix = f".{self.extension}"
+        files = glob.glob(os.path.join(self.root, countryName, f"*{suffix}"))
+        return sorted(os.path.basename(f)[:-len(suffix)] for f in files)
+
+    def _replace(self, tmpPath:str, path:str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmpPath, path)
+
+    def write(self, ticker:str, countryName:str, data:pd.DataFrame):
+        path = self.path(ticker, countryName)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmpPath = path + ".tmp"
+        data.to_csv(tmpPath)
+        self._replace(tmpPath, path)
+
+    def read(self, ticker:str, countryName:str, columns:list = None, start = None, end = None) -> pd.DataFrame:
+        usecols = None if columns is None else ["Date"] + [c for c in columns if c != "Date"]
+        data = pd.read_csv(self.path(ticker, countryName), usecols=usecols, index_col="Date")
+        data.index = _utc_index(data.index)
+        return _slice_dates(data, start, end)
+
+    def last_bars(self, ticker:str, countryName:str, count:int) -> pd.DataFrame:
+        # seek backwards from the end of the file so updates never parse the full history
+        with open(self.path(ticker, countryName), "rb") as f:
+            header = f.readline()
+            headerEnd = f.tell()
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            tail = b""
+            while position > headerEnd and tail.count(b"\n") <= count:
+                step = min(4096, position - headerEnd)
+                position -= step
+                f.seek(position)
+                tail = f.read(step) + tail
+        lines = [line for line in tail.splitlines() if line.strip()][-count:]
+        text = (header + b"\n".join(lines) + b"\n").decode()
+        data = pd.read_csv(io.StringIO(text), index_col="Date")
+        data.index = _utc_index(data.index)
+        return data
+
+    def append(self, ticker:str, countryName:str, newBars:pd.DataFrame):
+        path = self.path(ticker, countryName)
+        with open(path) as f:
+            columns = f.readline().strip().split(",")[1:]
+        tmpPath = path + ".tmp"
+        shutil.copyfile(path, tmpPath)
+        with open(tmpPath, "a") as f:
+            newBars.reindex(columns=columns).to_csv(f, header=False)
+        self._replace(tmpPath, path)
+
+class ParquetStore(CsvStore):
+    """Columnar store with int64 UTC nanosecond timestamps and predicate pushdown on Date."""
+    extension = "parquet"
+
+    def write(self, ticker:str, countryName:str, data:pd.DataFrame):
+        path = self.path(ticker, countryName)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmpPath = path + ".tmp"
+        table = pa.Table.from_pandas(_to_columnar(data), preserve_index=False)
+        self._write_table(table, tmpPath)
+        self._replace(tmpPath, path)
+
+    def _write_table(self, table, path:str):
+        pq.write_table(table, path, compression="zstd")
+
+    def _read_table(self, path:str, columns:list, start, end) -> pd.DataFrame:
+        filters = []
+        if start is not None:
+            filters.append(("Date", ">=", _date_bound(start)))
+        if end is not None:
+            filters.append(("Date", "<", _date_bound(end)))
+        return pq.read_table(path, columns=columns, filters=filters or None).to_pandas()
+
+    def read(self, ticker:str, countryName:str, columns:list = None, start = None, end = None) -> pd.DataFrame:
+        readColumns = None if columns is None else ["Date"] + [c for c in columns if c != "Date"]
+        frame = self._read_table(self.path(ticker, countryName), readColumns, start, end)
+        return _from_columnar(frame)
+
+    def last_bars(self, ticker:str, countryName:str, count:int) -> pd.DataFrame:
+        return self.read(ticker, countryName).iloc[-count:]
+
+    def append(self, ticker:str, countryName:str, newBars:pd.DataFrame):
+        stored = self.read(ticker, countryName)
+        newBars = newBars.copy()
+        newBars.index = _utc_index(newBars.index)
+        self.write(ticker, countryName, pd.concat([stored, newBars.reindex(columns=stored.columns)]))
+
+class FeatherStore(ParquetStore):
+    """Uncompressed Arrow IPC files, fastest to load when disk space is not a concern."""
+    extension = "feather"
+
+    def _write_table(self, table, path:str):
+        feather.write_feather(table, path, compression="uncompressed")
+
+    def _read_table(self, path:str, columns:list, start, end) -> pd.DataFrame:
+        frame = feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+        dates = frame["Date"].to_numpy()
+        mask = np.ones(len(frame), dtype=bool)
+        if start is not None:
+            mask &= dates >= _date_bound(start)
+        if end is not None:
+            mask &= dates < _date_bound(end)
+        return frame[mask].reset_index(drop=True)
+
+STORES = {
+    "csv": CsvStore,
+    "parquet": ParquetStore,
+    "feather": FeatherStore,
+}
+
+def get_store(backend:str = None, root:str = SCRAPED_ROOT) -> CsvStore:
+    backend = backend or STORE_BACKEND
+    if backend not in STORES:
+        raise ValueError(f"Unknown storage backend {backend}, expected one of {', '.join(STORES)}")
+    return STORES[backend](root)
+
+def convert_csv_store(countryName:str = None, backend:str = "parquet", root:str = SCRAPED_ROOT, removeCsv:bool = False) -> str:
+    """One-shot conversion of the existing CSV histories into a columnar backend."""
+    source = CsvStore(root)
+    target = get_store(backend, root)
+    countries = [countryName] if countryName else sorted(
+        d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+
+    converted = 0
+    for country in countries:
+        for ticker in source.list_tickers(country):
+            target.write(ticker, country, source.read(ticker, country))
+            if removeCsv:
+                os.remove(source.path(ticker, country))
+            converted += 1
+    return f"Converted {converted} tickers to {backend}"
+
+if __name__ == "__main__":
+    print(convert_csv_store())
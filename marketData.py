@@ -0,0 +1,172 @@
+# Cache-first market data shared by every page
+#
+# MarketDataProvider.history answers from three tiers in order: the scraped store under
+# data/scrapedData, a bounded in-process LRU with expiry, and finally yfinance for whatever
+# date range neither of them covers. Offline mode (offline=True or QUANTQUIPS_OFFLINE=1)
+# never touches the network and returns what is available locally.
+
+import os
+import re
+import threading
+from datetime import date, timedelta
+import pandas as pd
+import yfinance as yf
+from cachetools import TLRUCache
+from dataStore import SCRAPED_ROOT, get_store
+
+COUNTRY_TIMEZONES = {
+    "US": "America/New_York",
+    "IND": "Asia/Kolkata",
+}
+DAILY_INTERVALS = ("1d",)
+
+def _period_start(period:str):
+    """Translate a yfinance period string such as 10y or 6mo into a start date."""
+    if period in (None, "max"):
+        return None
+    today = pd.Timestamp(date.today())
+    if period == "ytd":
+        return pd.Timestamp(date(today.year, 1, 1))
+    match = re.fullmatch(r"(\d+)(d|wk|mo|y)", period)
+    if not match:
+        raise ValueError(f"Unsupported period {period}")
+    amount, unit = int(match.group(1)), match.group(2)
+    offsets = {
+        "d": pd.DateOffset(days=amount),
+        "wk": pd.DateOffset(weeks=amount),
+        "mo": pd.DateOffset(months=amount),
+        "y": pd.DateOffset(years=amount),
+    }
+    return today - offsets[unit]
+
+def _session_dates(data:pd.DataFrame, timezone:str = None) -> pd.DataFrame:
+    # daily bars are keyed by the exchange-local session date, the way yf.download returns them
+    index = pd.DatetimeIndex(data.index)
+    if index.tz is not None:
+        if timezone is not None:
+            index = index.tz_convert(timezone)
+        index = index.tz_localize(None)
+    data = data.copy()
+    data.index = pd.DatetimeIndex(index.normalize(), name="Date")
+    return data[~data.index.duplicated(keep="last")].sort_index()
+
+class MarketDataProvider:
+    def __init__(self, backend:str = None, root:str = SCRAPED_ROOT, maxEntries:int = 256, ttl:float = 900.0,
+                 intradayTtl:float = 60.0, offline:bool = None):
+        if offline is None:
+            offline = os.environ.get("QUANTQUIPS_OFFLINE", "").lower() in ("1", "true", "yes")
+        self.offline = offline
+        self.store = get_store(backend, root)
+        self.ttl = ttl
+        self.intradayTtl = intradayTtl
+        self._cache = TLRUCache(maxsize=maxEntries, ttu=self._expires_at)
+        self._lock = threading.Lock()
+        self._local = None
+
+    def _expires_at(self, key, value, now):
+        interval = key[4] if key[0] == "history" else "1d"
+        return now + (self.ttl if interval in DAILY_INTERVALS else self.intradayTtl)
+
+    def _cached(self, key, load):
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        value = load()
+        with self._lock:
+            self._cache[key] = value
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._local = None
+
+    def local_country(self, ticker:str):
+        """Country folder holding the scraped history of ticker, or None."""
+        if self._local is None:
+            local = {}
+            if os.path.isdir(self.store.root):
+                for country in sorted(os.listdir(self.store.root)):
+                    if os.path.isdir(os.path.join(self.store.root, country)):
+                        for name in self.store.list_tickers(country):
+                            local.setdefault(name, country)
+            self._local = local
+        return self._local.get(ticker)
+
+    def _fetch(self, ticker:str, start, end, period:str = None, interval:str = "1d") -> pd.DataFrame:
+        if self.offline:
+            return pd.DataFrame()
+        if period is not None:
+            return yf.Ticker(ticker).history(period=period, interval=interval)
+        return yf.Ticker(ticker).history(start=start, end=end, interval=interval)
+
+    def _load_daily(self, ticker:str, start, end) -> pd.DataFrame:
+        country = self.local_country(ticker)
+        frames = []
+        if country is not None:
+            local = _session_dates(self.store.read(ticker, country), COUNTRY_TIMEZONES.get(country))
+            if start is not None:
+                local = local[local.index >= start]
+            local = local[local.index < end]
+            frames.append(local)
+
+        # only the business days on either side of the stored history go to the network
+        missing = []
+        if not frames or frames[0].empty:
+            missing.append((start, end))
+        else:
+            first, last = frames[0].index[0], frames[0].index[-1]
+            if start is not None and len(pd.bdate_range(start, first - timedelta(days=1))) > 0:
+                missing.append((start, first))
+            if len(pd.bdate_range(last + timedelta(days=1), end - timedelta(days=1))) > 0:
+                missing.append((last + timedelta(days=1), end))
+        for rangeStart, rangeEnd in missing:
+            period = "max" if rangeStart is None else None
+            fetched = self._fetch(ticker, rangeStart, rangeEnd, period=period)
+            if not fetched.empty:
+                fetched = _session_dates(fetched)
+                fetched = fetched[fetched.index < end]
+                if rangeStart is not None:
+                    fetched = fetched[fetched.index >= rangeStart]
+                frames.append(fetched)
+
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame()
+        data = pd.concat(frames)
+        return data[~data.index.duplicated(keep="first")].sort_index()
+
+    def history(self, ticker:str, start = None, end = None, period:str = None, interval:str = "1d") -> pd.DataFrame:
+        """OHLCV history for ticker, end exclusive, like yf.Ticker(ticker).history.
+
+        Every call gets its own copy, the cached frame is shared by all sessions.
+        """
+        if interval not in DAILY_INTERVALS:
+            start = None if start is None else pd.Timestamp(start)
+            end = None if end is None else pd.Timestamp(end)
+            key = ("history", ticker, start, end, interval, period)
+            return self._cached(key, lambda: self._fetch(ticker, start, end, period=period, interval=interval)).copy()
+
+        if period is not None:
+            start = _period_start(period)
+        start = None if start is None else pd.Timestamp(start).normalize()
+        end = pd.Timestamp(date.today() + timedelta(days=1)) if end is None else pd.Timestamp(end).normalize()
+        key = ("history", ticker, start, end, interval)
+        return self._cached(key, lambda: self._load_daily(ticker, start, end)).copy()
+
+    def ticker(self, ticker:str):
+        """Shared yf.Ticker for fundamentals, or None when running offline."""
+        if self.offline:
+            return None
+        return self._cached(("ticker", ticker), lambda: yf.Ticker(ticker))
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_provider() -> MarketDataProvider:
+    """Process-wide provider so every page and session shares one cache."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = MarketDataProvider()
+        return _provider
@@ -0,0 +1,89 @@
+# Monte Carlo robustness check of a completed backtest
+#
+# Two resamplings of what a run actually did: drawing its closed-trade returns with
+# replacement, which shuffles the order and mix of trades, and a circular block bootstrap of
+# its per-bar returns, which keeps the volatility clustering inside each block. Paths are
+# generated in fixed-size chunks from a seeded generator per chunk, so memory stays bounded by
+# chunkPaths × horizon whatever the number of paths, and the same seed gives the same bands.
+# Only each path's final equity, maximum drawdown and the equity at a few hundred checkpoints
+# are kept.
+
+import numpy as np
+import pandas as pd
+from analytics import max_drawdown
+
+METHODS = ["Block bootstrap", "Trade resampling"]
+PATHS = 10_000
+CHUNK_PATHS = 500
+BLOCK_SIZE = 20
+CHECKPOINTS = 250
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+def block_bootstrap(returns:np.ndarray, paths:int, blockSize:int, rng:np.random.Generator, horizon:int = None) -> np.ndarray:
+    """(paths, horizon) returns made of blocks of consecutive bars, wrapping around the end."""
+    returns = np.asarray(returns, dtype=np.float64)
+    horizon = horizon or len(returns)
+    blockSize = max(1, min(blockSize, len(returns)))
+    blocks = -(-horizon // blockSize)
+    starts = rng.integers(0, len(returns), size=(paths, blocks, 1))
+    rows = (starts + np.arange(blockSize)) % len(returns)
+    return returns[rows.reshape(paths, -1)[:, :horizon]]
+
+def resample_trades(tradeReturns:np.ndarray, paths:int, rng:np.random.Generator, trades:int = None) -> np.ndarray:
+    """(paths, trades) trade returns drawn with replacement."""
+    tradeReturns = np.asarray(tradeReturns, dtype=np.float64)
+    return tradeReturns[rng.integers(0, len(tradeReturns), size=(paths, trades or len(tradeReturns)))]
+
+def equity_paths(returns:np.ndarray, initial_cash) -> np.ndarray:
+    """Compounded equity of every row of returns, starting column included."""
+    with np.errstate(divide="ignore"):
+        growth = np.log1p(np.maximum(returns, -1.0))
+    logEquity = np.zeros((returns.shape[0], returns.shape[1] + 1))
+    np.cumsum(growth, axis=1, out=logEquity[:, 1:])
+    return initial_cash * np.exp(logEquity)
+
+def monte_carlo(samples:np.ndarray, initial_cash, method:str = "Block bootstrap", paths:int = PATHS,
+                blockSize:int = BLOCK_SIZE, horizon:int = None, seed:int = 0, chunkPaths:int = CHUNK_PATHS,
+                checkpoints:int = CHECKPOINTS) -> dict:
+    """Resample a run's per-bar returns (block bootstrap) or trade returns (trade resampling).
+
+    Returns the final equity and maximum drawdown of every path plus the equity of every path
+    at up to checkpoints evenly spaced steps.
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    samples = samples[np.isfinite(samples)]
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method}")
+    if len(samples) == 0:
+        raise ValueError("No returns to resample")
+    if paths <= 0:
+        raise ValueError("paths must be positive")
+    horizon = horizon or len(samples)
+    steps = np.unique(np.linspace(0, horizon, min(checkpoints, horizon) + 1).astype(np.int64))
+    finals = np.empty(paths)
+    drawdowns = np.empty(paths)
+    sampled = np.empty((paths, len(steps)))
+    chunks = np.random.SeedSequence(seed).spawn(-(-paths // chunkPaths))
+    for i, chunkSeed in enumerate(chunks):
+        rng = np.random.default_rng(chunkSeed)
+        rows = slice(i * chunkPaths, min(paths, (i + 1) * chunkPaths))
+        count = rows.stop - rows.start
+        if method == "Block bootstrap":
+            returns = block_bootstrap(samples, count, blockSize, rng, horizon)
+        else:
+            returns = resample_trades(samples, count, rng, horizon)
+        equity = equity_paths(returns, initial_cash)
+        finals[rows] = equity[:, -1]
+        drawdowns[rows] = max_drawdown(equity)
+        sampled[rows] = equity[:, steps]
+    return {'final': finals, 'drawdown': drawdowns, 'steps': steps, 'equity': sampled}
+
+def confidence_bands(simulation:dict, quantiles:tuple = QUANTILES):
+    """(summary, bands): quantiles of final equity and drawdown, and of equity at every checkpoint."""
+    summary = pd.DataFrame({
+        'Final Equity': np.quantile(simulation['final'], quantiles),
+        'Max Drawdown %': np.quantile(simulation['drawdown'], quantiles) * 100.0,
+    }, index=[f"{q:.0%}" for q in quantiles])
+    bands = pd.DataFrame(np.quantile(simulation['equity'], quantiles, axis=0).T, index=simulation['steps'],
+                         columns=[f"{q:.0%}" for q in quantiles])
+    return summary, bands
@@ -0,0 +1,377 @@
+# Parameter search for strategies on the worker pool
+#
+# Parameter points are split into chunks and sent to the shared worker pool with the prices in
+# shared memory. A worker builds one feed (or one vectorized indicator set) per chunk, runs
+# every point of the chunk on it and sends back one small record per point: the parameters and
+# the run's performance metrics. No strategy object ever leaves a worker, so the server holds
+# only the records whatever the size of the grid. Workers stop at the next point once the
+# ProgressChannel is cancelled.
+# genetic_search evolves parameter sets instead of running every combination; each
+# generation is one parallel run_points call over the parameter sets it has not seen yet.
+# successive_halving runs every point on a short prefix of the history and only the best
+# fraction on longer ones, resuming vectorized runs where the previous prefix ended.
+# Grids of MovingAverageCrossover periods skip the pool: vectorBacktest sweeps them as
+# matrices in a fraction of the time it takes to ship them to workers.
+
+from contextlib import closing
+from concurrent.futures import as_completed
+import numpy as np
+import backtrader as bt
+from analytics import performance, performance_table
+from arrayFeed import ArrayData, indicator_set
+from backtestCharts import EquityRecorder
+from backtestRunner import get_pool, is_uploaded, resolve_strategy, submit
+from priceFeed import PriceArrays, attach_arrays, share_arrays
+from runProgress import ProgressChannel
+from studyStore import Study, point_key
+from walkForward import parameter_grid
+import vectorBacktest
+
+CHUNK_SIZE = 16
+
+def evaluate(strategy, arrays:PriceArrays, points:list, initial_cash, commission, progress:ProgressChannel = None) -> list:
+    """One record per point, {**params, 'Ending Value', **metrics}, until progress is cancelled."""
+    records = []
+    if vectorBacktest.supports(strategy):
+        # one indicator set per price series and worker, shared by all its chunks
+        indicators = indicator_set(arrays.digest(), arrays.close)
+        feed = None
+    else:
+        # cerebro resets and re-preloads an added feed on every run, its buffers are built once
+        indicators = None
+        feed = ArrayData(arrays=arrays)
+    for params in points:
+        if progress is not None and progress.is_cancelled():
+            break
+        if feed is None:
+            result, curves = vectorBacktest.run_vectorized(strategy, arrays, initial_cash, commission,
+                                                           indicators=indicators, **params)
+            equity, position, trades = curves['equity'], curves['position'], None
+            ending = result['Ending Value']
+        else:
+            cerebro = bt.Cerebro(stdstats=False)
+            cerebro.adddata(feed)
+            cerebro.addstrategy(strategy, **params)
+            cerebro.broker.set_cash(initial_cash)
+            cerebro.broker.setcommission(commission=commission)
+            cerebro.addanalyzer(EquityRecorder, _name='equity')
+            recorded = cerebro.run()[0].analyzers.equity.get_analysis()
+            equity, position, trades = recorded['equity'], recorded['position'], recorded['trades']
+            ending = cerebro.broker.getvalue()
+        # the recorded bars are the last len(equity) bars of the feed
+        bars = slice(len(arrays) - len(equity), None)
+        records.append({**params, 'Ending Value': ending,
+                        **performance(equity, position, arrays.close[bars], trades, arrays.dates[bars])})
+    return records
+
+def _run_chunk(spec, descriptor, points, initial_cash, commission, progress = None):
+    block, arrays = attach_arrays(descriptor)
+    try:
+        return evaluate(resolve_strategy(spec), arrays, points, initial_cash, commission, progress)
+    finally:
+        del arrays
+        block.close()
+
+def _map_chunks(spec, arrays:PriceArrays, items:list, function, args:tuple, chunkSize:int, maxWorkers:int,
+                progress:ProgressChannel):
+    # yields (results or exception, chunk, itemsDone) for function(spec, descriptor, chunk, *args, progress)
+    block, descriptor = share_arrays(arrays)
+    futures = {}
+    try:
+        pool = get_pool(maxWorkers)
+        for i in range(0, len(items), chunkSize):
+            chunk = items[i:i + chunkSize]
+            futures[submit(pool, function, [spec], spec, descriptor, chunk, *args, progress)] = chunk
+        done = 0
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                results = e
+            done += len(chunk)
+            yield results, chunk, done
+    finally:
+        if progress is not None:
+            progress.cancel()
+        for future in futures:
+            future.cancel()
+        block.close()
+        block.unlink()
+
+def run_points(spec, arrays:PriceArrays, points:list, initial_cash, commission, chunkSize:int = CHUNK_SIZE,
+               maxWorkers:int = None, progress:ProgressChannel = None):
+    """Yield (records, pointsDone) as each chunk of points finishes, in completion order.
+
+    Closing the generator early cancels queued chunks and, with a progress channel, makes
+    running chunks stop at their next point.
+    """
+    chunks = _map_chunks(spec, arrays, points, _run_chunk, (initial_cash, commission), chunkSize, maxWorkers, progress)
+    with closing(chunks):
+        for records, chunk, done in chunks:
+            if isinstance(records, Exception):
+                records = [{**params, 'Error': str(records)} for params in chunk]
+            yield records, done
+
+def sweep_points(strategy, arrays:PriceArrays, points:list, initial_cash, commission, progress:ProgressChannel = None,
+                 metrics:bool = True):
+    """Like run_points for a MovingAverageCrossover grid, simulated as matrices in this process.
+
+    Without metrics the records only carry the ending value.
+    """
+    defaults = vectorBacktest.strategy_params(strategy)
+    pairs = [(params.get('short_period', defaults['short_period']), params.get('long_period', defaults['long_period']))
+             for params in points]
+    close = np.ascontiguousarray(arrays.close, dtype=np.float64)
+    done = 0
+    sweep = vectorBacktest.ma_crossover_sweep(close, arrays.open, pairs, initial_cash, commission)
+    with closing(sweep):
+        for chunk, cash, position in sweep:
+            if progress is not None and progress.is_cancelled():
+                break
+            equity = cash + position * close
+            rows = performance_table(equity, position, close, arrays.dates).to_dict('records') if metrics else \
+                [{}] * len(chunk)
+            records = [{**params, 'Ending Value': float(ending), **row}
+                       for params, ending, row in zip(points[done:done + len(chunk)], equity[:, -1], rows)]
+            done += len(chunk)
+            yield records, done
+
+def _recorded(runs, study:Study, names:list, skipped:int):
+    # stores every chunk as it finishes; done counts the points the study already had too
+    with closing(runs):
+        for records, done in runs:
+            study.record(names, records)
+            yield records, skipped + done
+
+def grid_search(spec, arrays:PriceArrays, grid:dict, initial_cash, commission, chunkSize:int = CHUNK_SIZE,
+                maxWorkers:int = None, progress:ProgressChannel = None, study:Study = None):
+    """run_points over every combination of grid, {param: values}; a sweep where the strategy allows it.
+
+    With a study, points it already holds are skipped and new records are stored as they come.
+    """
+    points = parameter_grid(grid)
+    skipped = 0
+    if study is not None:
+        evaluated = study.evaluated()
+        total = len(points)
+        points = [params for params in points if point_key(params) not in evaluated]
+        skipped = total - len(points)
+    if not is_uploaded(spec) and vectorBacktest.sweeps(spec, grid):
+        runs = sweep_points(spec, arrays, points, initial_cash, commission, progress)
+    else:
+        runs = run_points(spec, arrays, points, initial_cash, commission, chunkSize, maxWorkers, progress)
+    return runs if study is None else _recorded(runs, study, list(grid), skipped)
+
+def parameter_space(strategy) -> dict:
+    """Default search space of a strategy: half to twice every numeric parameter's default."""
+    space = {}
+    for name, default in strategy.params._getpairs().items():
+        if isinstance(default, bool) or not isinstance(default, (int, float)):
+            continue
+        if isinstance(default, int):
+            space[name] = (max(1, default // 2), max(2, default * 2))
+        else:
+            space[name] = (default / 2, default * 2)
+    return space
+
+def _sample(bounds, rng):
+    if isinstance(bounds, list):
+        return bounds[rng.integers(len(bounds))]
+    low, high = bounds
+    if isinstance(low, int) and isinstance(high, int):
+        return int(rng.integers(low, high + 1))
+    return float(rng.uniform(low, high))
+
+def _mutate(value, bounds, rng):
+    if isinstance(bounds, list):
+        return bounds[rng.integers(len(bounds))]
+    low, high = bounds
+    # a step of about a tenth of the range, so mutations refine as well as explore
+    step = rng.normal(0.0, max((high - low) / 10, 1e-12))
+    if isinstance(low, int) and isinstance(high, int):
+        return int(np.clip(round(value + (step if abs(step) >= 0.5 else np.sign(step))), low, high))
+    return float(np.clip(value + step, low, high))
+
+def fitness(record:dict, metric:str) -> float:
+    value = record.get(metric)
+    return float(value) if value is not None and np.isfinite(value) else -np.inf
+
+def genetic_search(spec, arrays:PriceArrays, space:dict, initial_cash, commission, population:int = 24,
+                   generations:int = 10, mutation:float = 0.2, crossover:float = 0.7, elitism:int = 2,
+                   metric:str = "Ending Value", seed:int = 0, evaluated:dict = None, chunkSize:int = 4,
+                   maxWorkers:int = None, study:Study = None):
+    """Evolve parameter sets over space, {param: (low, high) or [choices]}; maximizes metric.
+
+    Each generation's new parameter sets run in parallel through run_points; a parameter set
+    seen before, in this search, in evaluated or in study, is never run again. Yields
+    (generation, evaluated, best record) after every generation, evaluated mapping parameter
+    tuples, in the order of space, to records. New records are stored in study as they come.
+    """
+    if population < 2:
+        raise ValueError("population must be at least 2")
+    if not 0 <= elitism < population:
+        raise ValueError("elitism must be smaller than the population")
+    names = list(space)
+    evaluated = {} if evaluated is None else evaluated
+    if study is not None:
+        for record in study.evaluated().values():
+            if all(name in record for name in names):
+                evaluated.setdefault(tuple(record[name] for name in names), record)
+    rng = np.random.default_rng(seed)
+    members = [tuple(_sample(space[name], rng) for name in names) for _ in range(population)]
+    for generation in range(generations):
+        new = list(dict.fromkeys(member for member in members if member not in evaluated))
+        if new:
+            # a fresh channel per generation, run_points cancels it when it finishes
+            runs = run_points(spec, arrays, [dict(zip(names, member)) for member in new], initial_cash, commission,
+                              chunkSize, maxWorkers, ProgressChannel())
+            with closing(runs):
+                for records, _ in runs:
+                    for record in records:
+                        evaluated[tuple(record[name] for name in names)] = record
+                    if study is not None:
+                        study.record(names, records)
+        ranked = sorted(members, key=lambda member: fitness(evaluated[member], metric), reverse=True)
+        yield generation, evaluated, evaluated[ranked[0]]
+        if generation == generations - 1:
+            break
+
+        def tournament():
+            # the fittest of three random members
+            picks = rng.integers(len(ranked), size=3)
+            return ranked[picks.min()]
+
+        children = ranked[:elitism]
+        while len(children) < population:
+            first, second = tournament(), tournament()
+            if rng.random() < crossover:
+                child = tuple(a if rng.random() < 0.5 else b for a, b in zip(first, second))
+            else:
+                child = first
+            child = tuple(_mutate(value, space[name], rng) if rng.random() < mutation else value
+                          for value, name in zip(child, names))
+            children.append(child)
+        members = children
+
+def pack_state(cash:np.ndarray, position:np.ndarray) -> tuple:
+    """Cash and position curves as (bars, change bars, cash, position); both only move on fills."""
+    changes = np.flatnonzero((np.diff(cash, prepend=np.nan) != 0.0) | (np.diff(position, prepend=np.nan) != 0.0))
+    return len(cash), changes.astype(np.int32), cash[changes], position[changes]
+
+def unpack_state(state:tuple):
+    bars, changes, cash, position = state
+    counts = np.diff(changes, append=bars)
+    return np.repeat(cash, counts), np.repeat(position, counts)
+
+def advance(strategy, arrays:PriceArrays, params:dict, state:tuple, end:int, initial_cash, commission,
+            indicators:vectorBacktest.Indicators = None):
+    """Continue one vectorized run to bar end from a packed state, or from the start without one.
+
+    Returns the cash and position curves up to end.
+    """
+    close = np.ascontiguousarray(arrays.close, dtype=np.float64)
+    # indicators and signals are causal, those of the full history hold for every prefix
+    signals = vectorBacktest.SIGNALS[strategy.__name__](close, indicators=indicators,
+                                                        **vectorBacktest.strategy_params(strategy, **params))[:end]
+    open_ = np.asarray(arrays.open[:end], dtype=np.float64)
+    close = close[:end]
+    if state is None:
+        return vectorBacktest.simulate(signals, open_, close, initial_cash, commission)
+    cashCurve, positionCurve = unpack_state(state)
+    start = len(cashCurve)
+    # resume from the last simulated bar, which simulate replays without trading
+    cash, position = vectorBacktest.simulate(signals[start - 1:], open_[start - 1:], close[start - 1:],
+                                             cashCurve[-1], commission, positionCurve[-1])
+    return np.concatenate([cashCurve, cash[1:]]), np.concatenate([positionCurve, position[1:]])
+
+def _run_rung(spec, descriptor, items, end, initial_cash, commission, metrics, progress = None):
+    block, arrays = attach_arrays(descriptor)
+    prefix = arrays.head(end)
+    try:
+        strategy = resolve_strategy(spec)
+        if not vectorBacktest.supports(strategy):
+            # backtrader runs cannot be resumed, they replay the whole prefix
+            records = evaluate(strategy, prefix, [params for params, _ in items], initial_cash, commission, progress)
+            return [(record, None) for record in records]
+        indicators = indicator_set(arrays.digest(), arrays.close)
+        results = []
+        for params, state in items:
+            if progress is not None and progress.is_cancelled():
+                break
+            cash, position = advance(strategy, arrays, params, state, end, initial_cash, commission, indicators)
+            equity = cash + position * prefix.close
+            record = {**params, 'Ending Value': float(equity[-1])}
+            if metrics:
+                record.update(performance(equity, position, prefix.close, None, prefix.dates))
+            results.append((record, pack_state(cash, position)))
+        return results
+    finally:
+        del arrays, prefix
+        block.close()
+
+def halving_budgets(bars:int, candidates:int, eta:int = 3, minBars:int = None, topK:int = 10) -> list:
+    """Bars of history each rung is evaluated on, the last rung on all of them.
+
+    Rankings on much less than a third of the history were mostly noise on the bundled data,
+    so by default the first rung sees bars // eta of them.
+    """
+    if eta < 2:
+        raise ValueError("eta must be at least 2")
+    minBars = bars // eta if minBars is None else minBars
+    rungs = int(np.ceil(np.log(max(1.0, candidates / max(1, topK))) / np.log(eta))) + 1
+    # no rung on fewer than minBars bars, but always the one on the whole history
+    rungs = max(1, min(rungs, int(np.floor(np.log(max(1, bars) / max(1, minBars)) / np.log(eta) + 1e-9)) + 1))
+    return [int(round(bars / eta ** (rungs - 1 - rung))) for rung in range(rungs)]
+
+def successive_halving(spec, arrays:PriceArrays, points:list, initial_cash, commission, metric:str = "Ending Value",
+                       eta:int = 3, minBars:int = None, topK:int = 10, chunkSize:int = CHUNK_SIZE, maxWorkers:int = None,
+                       study:Study = None):
+    """Run every point on a short prefix, keep the best 1/eta, extend their history and repeat.
+
+    Yields (rung, bars, records) after each rung, records ranked by metric; the last rung runs
+    the survivors, never fewer than topK, on the whole history. Grids the matrix sweep covers
+    run each rung as matrices from the first bar; other vectorized strategies carry their cash
+    and position from one rung to the next and only simulate the new bars. Only
+    the last rung, run on the whole history, is stored in study; points the study already
+    holds skip the rungs and join the last one with their stored records.
+    """
+    names = list(points[0]) if points else []
+    known = []
+    if study is not None:
+        evaluated = study.evaluated()
+        known = [evaluated[point_key(params)] for params in points if point_key(params) in evaluated]
+        points = [params for params in points if point_key(params) not in evaluated]
+    budgets = halving_budgets(len(arrays), len(points), eta, minBars, topK)
+    items = [(params, None) for params in points]
+    # a grid the matrix sweep covers replays every rung from the first bar as matrices, which
+    # beats resuming the points one by one
+    sweep = not is_uploaded(spec) and vectorBacktest.sweeps(spec, names)
+    for rung, end in enumerate(budgets):
+        results = []
+        # ranking by ending value needs no other metric before the last rung
+        metrics = metric != "Ending Value" or end == budgets[-1]
+        if sweep:
+            runs = sweep_points(spec, arrays.head(end), [params for params, _ in items], initial_cash, commission,
+                                metrics=metrics)
+            with closing(runs):
+                for records, _ in runs:
+                    results.extend((record, None) for record in records)
+        else:
+            # a fresh channel per rung, _map_chunks cancels it when it finishes
+            chunks = _map_chunks(spec, arrays, items, _run_rung, (end, initial_cash, commission, metrics), chunkSize,
+                                 maxWorkers, ProgressChannel())
+            with closing(chunks):
+                for outcome, chunk, _ in chunks:
+                    if isinstance(outcome, Exception):
+                        outcome = [({**params, 'Error': str(outcome)}, None) for params, _ in chunk]
+                    results.extend(outcome)
+        if study is not None and end == budgets[-1]:
+            study.record(names, [record for record, _ in results])
+            results.extend((record, None) for record in known)
+        results.sort(key=lambda result: fitness(result[0], metric), reverse=True)
+        yield rung, end, [record for record, _ in results]
+        survivors = max(topK, int(np.ceil(len(results) / eta)))
+        # records carry the metrics of the rung, only the parameters go on
+        items = [({name: record[name] for name in names}, state) for record, state in results[:survivors]
+                 if 'Error' not in record]
@@ -1,11 +1,11 @@
 import streamlit as st
 import os
 import json
-import yfinance as yf
 import pandas as pd
 import plotly.graph_objects as go
 from datetime import datetime
 from groq import Groq
+from marketData import get_provider
 # Set page config
 st.set_page_config(page_title="QuantQuips", page_icon="chart_with_upwards_trend", layout='wide')
 
@@ -17,9 +17,10 @@ client = Groq(api_key=GROQ_API_KEY)
 
 def get_stock_data(ticker):
     """Fetch stock data and company info."""
-    stock = yf.Ticker(ticker)
-    hist = stock.history(period="5y")
-    company_info = stock.info
+    provider = get_provider()
+    hist = provider.history(ticker, period="5y")
+    stock = provider.ticker(ticker)
+    company_info = stock.info if stock is not None else {}
     return hist, company_info
 
 def calculate_ratios(stock_data, company_info):
@@ -67,7 +68,9 @@ ticker = st.text_input("Enter a stock ticker (e.g., AAPL):")
 
 if st.button("Get Advice"):
     with st.spinner("Gathering information..."):
-        if ticker:
+        if ticker and get_provider().offline:
+            st.warning("Company financials need network access, QuantQuips is running offline.")
+        elif ticker:
             # Get stock data and company info
             stock_data, company_info = get_stock_data(ticker)
             company_overview = {
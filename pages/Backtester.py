@@ -4,86 +4,37 @@ import matplotlib.pyplot as plt
 matplotlib.use('Agg')
 import streamlit as st
 import pandas as pd
-import backtrader as bt
-import yfinance as yf
-import inspect
+import time
+from contextlib import closing
+from cleanData import clean_history
+from priceFeed import PriceArrays, load_csv_stream
+from strategies import BUILTIN_STRATEGIES
+from backtestRunner import run_strategies, strategy_name, strategy_spec
+from resultCache import result_key
+from backtestCharts import render_png
+from batchBacktest import load_universe, run_universe, universe_sources
+from monteCarlo import BLOCK_SIZE, METHODS, PATHS, confidence_bands, monte_carlo
+from strategySandbox import load_strategy_files, register_source
+from runProgress import ProgressChannel
 
-# Strategies
 st.set_page_config(page_title="Backtester", page_icon="chart_with_upwards_trend", layout='wide')
-class MovingAverageCrossover(bt.Strategy):
-    params = (
-        ('short_period', 10),
-        ('long_period', 50),
-    )
-
-    def __init__(self):
-        self.short_ma = bt.indicators.SimpleMovingAverage(self.data.close, period=self.params.short_period)
-        self.long_ma = bt.indicators.SimpleMovingAverage(self.data.close, period=self.params.long_period)
-        self.crossover = bt.indicators.CrossOver(self.short_ma, self.long_ma)
-
-    def next(self):
-        if self.crossover > 0:
-            self.buy()
-        elif self.crossover < 0:
-            self.sell()
-
-class RSIStrategy(bt.Strategy):
-    params = (
-        ('rsi_period', 14),
-        ('overbought', 70),
-        ('oversold', 30),
-    )
-
-    def __init__(self):
-        self.rsi = bt.indicators.RelativeStrengthIndex(self.data.close, period=self.params.rsi_period)
-
-    def next(self):
-        if self.rsi < self.params.oversold:
-            self.buy()
-        elif self.rsi > self.params.overbought:
-            self.sell()
-
-class BollingerBandsStrategy(bt.Strategy):
-    params = (
-        ('period', 20),
-        ('devfactor', 2),
-    )
-
-    def __init__(self):
-        self.bollinger = bt.indicators.BollingerBands(self.data.close, period=self.params.period, devfactor=self.params.devfactor)
-
-    def next(self):
-        if self.data.close < self.bollinger.lines.bot:
-            self.buy()
-        elif self.data.close > self.bollinger.lines.top:
-            self.sell()
-
-class MACDStrategy(bt.Strategy):
-    params = (
-        ('fast_ema', 12),
-        ('slow_ema', 26),
-        ('signal', 9),
-    )
-
-    def __init__(self):
-        self.macd = bt.indicators.MACD(self.data.close, 
-                                       period_me1=self.params.fast_ema, 
-                                       period_me2=self.params.slow_ema, 
-                                       period_signal=self.params.signal)
-
-    def next(self):
-        if self.macd.macd > self.macd.signal:
-            self.buy()
-        elif self.macd.macd < self.macd.signal:
-            self.sell()
-
 def initialize_session():
     if 'strategies' not in st.session_state:
-        st.session_state['strategies'] = [MovingAverageCrossover, RSIStrategy, BollingerBandsStrategy, MACDStrategy]
-    if 'data' not in st.session_state:
-        st.session_state['data'] = None
+        st.session_state['strategies'] = list(BUILTIN_STRATEGIES)
+    if 'price_arrays' not in st.session_state:
+        # prices are kept as compact arrays, a DataFrame is only built where one is needed
+        st.session_state['price_arrays'] = None
     if 'results' not in st.session_state:
         st.session_state['results'] = []
+    if 'batch_results' not in st.session_state:
+        st.session_state['batch_results'] = []
+    if 'charts' not in st.session_state:
+        st.session_state['charts'] = []
+    if 'monte_carlo' not in st.session_state:
+        st.session_state['monte_carlo'] = None
+    if 'strategy_sources' not in st.session_state:
+        # uploaded strategies are kept as source only, they are built and run in sandbox workers
+        st.session_state['strategy_sources'] = {spec['name']: spec['source'] for spec in load_strategy_files()}
     if 'new_strategy_code' not in st.session_state:
         st.session_state['new_strategy_code'] = ""
     if 'strategies_to_run' not in st.session_state:
@@ -91,24 +42,27 @@ def initialize_session():
 
 initialize_session()
 
-def run_strategy(strategy, data_feed, initial_cash, commission):
-    cerebro = bt.Cerebro()
-    cerebro.adddata(data_feed)
-    cerebro.addstrategy(strategy)
-    cerebro.broker.set_cash(initial_cash)
-    cerebro.broker.setcommission(commission=commission)
-    
-    starting_value = cerebro.broker.getvalue()
-    cerebro.run()
-    figure = cerebro.plot(dpi=1000)[0][0]
-    ending_value = cerebro.broker.getvalue()
-
-    return {
-        'Strategy': strategy.__name__,
-        'Starting Value': starting_value,
-        'Ending Value': ending_value
-    }, {'figure':figure,
-        'name':strategy.__name__}
+@st.cache_data(max_entries=64, show_spinner=False)
+def chart_png(key, _series, name):
+    # key is chart_key(), the series themselves are not hashed
+    return render_png(_series, name)
+
+def chart_key(spec, data_digest, initial_cash, commission):
+    # the result cache key covers the data, the strategy source and every parameter, defaults included
+    key = result_key(spec, data_digest, initial_cash, commission)
+    return key or (data_digest, strategy_name(spec), initial_cash, commission)
+
+def strategy_names():
+    return [strat.__name__ for strat in st.session_state['strategies']] + list(st.session_state['strategy_sources'])
+
+def selected_specs(strategy_names):
+    specs = []
+    for name in strategy_names:
+        if name in st.session_state['strategy_sources']:
+            specs.append(strategy_spec(name, st.session_state['strategy_sources'][name]))
+        else:
+            specs.append(next(strat for strat in st.session_state['strategies'] if strat.__name__ == name))
+    return specs
 
 st.title('Backtester')
 
@@ -124,61 +78,171 @@ uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
 initial_cash = st.number_input('Initial Cash', value=10000)
 commission = st.number_input('Broker Commission', value=0.001)
 
-strategies_to_run = st.multiselect('Select Strategies to Run', [strat.__name__ for strat in st.session_state['strategies']], default=st.session_state['strategies_to_run'])
+strategies_to_run = st.multiselect('Select Strategies to Run', strategy_names(), default=st.session_state['strategies_to_run'])
 
 st.session_state['new_strategy_code'] = st.text_area("Paste your strategy class code here", st.session_state['new_strategy_code'], height=300)
 
+def add_uploaded(specs):
+    new_names = [spec['name'] for spec in specs if spec['name'] not in strategy_names()]
+    for spec in specs:
+        if spec['name'] in new_names:
+            st.session_state['strategy_sources'][spec['name']] = spec['source']
+            st.session_state['strategies_to_run'].append(spec['name'])
+    return new_names
+
 if st.button("Upload Strategy"):
     try:
-        exec(st.session_state['new_strategy_code'], globals())
-        # Find the newly uploaded class by finding the last class defined
-        new_classes = [cls for cls in globals().values() if inspect.isclass(cls) and issubclass(cls, bt.Strategy) and cls.__module__ == '__main__']
-        if not new_classes:
+        # the code is only parsed here, it first runs inside a sandbox worker
+        specs = register_source(st.session_state['new_strategy_code'])
+        if not specs:
             st.warning("Please paste a valid Backtrader strategy class for testing.")
+        # the last class defined is the one being uploaded
+        elif add_uploaded(specs[-1:]):
+            st.success(f"Uploaded strategy: {specs[-1]['name']}")
         else:
-            new_strategy_class = new_classes[-1]
-            if new_strategy_class not in st.session_state['strategies']:
-                st.session_state['strategies'].append(new_strategy_class)
-                st.session_state['strategies_to_run'].append(new_strategy_class.__name__)
-                st.success(f"Uploaded strategy: {new_strategy_class.__name__}")
-            else:
-                st.warning("This strategy is already uploaded.")
-    except Exception as e:
+            st.warning("This strategy is already uploaded.")
+    except (SyntaxError, ValueError) as e:
         st.warning(f"An error occurred: {e}")
 
+strategy_file = st.file_uploader("Or load strategy classes from a file", type=["txt", "py"])
+if strategy_file is not None and st.button("Load Strategy File"):
+    try:
+        loaded = add_uploaded(register_source(strategy_file.getvalue().decode()))
+        if loaded:
+            st.success(f"Loaded strategies: {', '.join(loaded)}")
+        else:
+            st.warning("No new strategy classes found in this file.")
+    except (SyntaxError, UnicodeDecodeError, ValueError) as e:
+        st.warning(f"An error occurred: {e}")
+
+results_table = st.empty()
+
 if st.button("Run Backtest"):
     if not uploaded_file and not st.session_state['ticker']:
         st.warning("Please provide a ticker symbol or upload a CSV file with historical data.")
     else:
         if uploaded_file:
-            st.session_state['data'] = pd.read_csv(uploaded_file, index_col='Date', parse_dates=True)
+            try:
+                price_arrays = load_csv_stream(uploaded_file)
+                for issue in price_arrays.issues:
+                    st.info(issue)
+                st.session_state['price_arrays'] = price_arrays
+            except ValueError as e:
+                st.warning(f"Could not load the CSV file: {e}")
+                st.session_state['price_arrays'] = None
         else:
-            st.session_state['data'] = yf.download(st.session_state['ticker'], start=st.session_state['start_date'], end=st.session_state['end_date'])
+            history = clean_history(st.session_state['ticker'], start=st.session_state['start_date'], end=st.session_state['end_date'])
+            st.session_state['price_arrays'] = None if history.empty else PriceArrays.from_frame(history)
 
-        if st.session_state['data'] is not None and not st.session_state['data'].empty:
-            data_feed = bt.feeds.PandasData(dataname=st.session_state['data'])
+        if st.session_state['price_arrays'] is not None and not st.session_state['price_arrays'].empty:
+            price_arrays = st.session_state['price_arrays']
+            specs = selected_specs(strategies_to_run)
+            spec_by_name = {strategy_name(spec): spec for spec in specs}
 
+            # strategies run in parallel worker processes, the table fills in as each one finishes
+            data_digest = price_arrays.digest()
             st.session_state['results'] = []
-            st.session_state['fig'] = []
-            for strategy_name in strategies_to_run:
-                strategy_class = next(strat for strat in st.session_state['strategies'] if strat.__name__ == strategy_name)
-                result, figure = run_strategy(strategy_class, data_feed, initial_cash, commission)
-                st.session_state['results'].append(result)
-                st.session_state['fig'].append(figure)
-
-            results_df = pd.DataFrame(st.session_state['results'])
-            
-            st.table(results_df)
-            col1,col2 = st.columns(2)
-            with col1:
-                for i in range(0,2):
-                    with st.container(height=500):
-                        st.subheader(st.session_state['fig'][i]['name'])
-                        st.pyplot(st.session_state['fig'][i]['figure'])
-            with col2:
-                for i in range(2,4):
-                    with st.container(height=500):
-                        st.subheader(st.session_state['fig'][i]['name'])
-                        st.pyplot(st.session_state['fig'][i]['figure'])
+            st.session_state['charts'] = []
+            st.session_state['monte_carlo'] = None
+            # any click while this runs reruns the page, which closes the run and cancels it
+            st.button("Cancel Run")
+            live_cols = st.columns(2)
+            live_panels = {}
+            for i, spec in enumerate(specs):
+                with live_cols[i % 2]:
+                    live_panels[strategy_name(spec)] = st.empty()
+            live = {}
+
+            def show_progress(events):
+                for event in events:
+                    state = live.setdefault(event['task'], {'dates': [], 'values': []})
+                    state.update(event)
+                    state['dates'].append(event['date'])
+                    state['values'].append(event['value'])
+                for name, state in live.items():
+                    with live_panels[name].container():
+                        done = f"{state['bars']} / {state['total']}" if state['total'] else f"{state['bars']}"
+                        st.caption(f"{name}: {done} bars, {state['trades']} closed trades")
+                        if state['total']:
+                            st.progress(min(1.0, state['bars'] / state['total']))
+                        st.line_chart(pd.Series(state['values'], index=state['dates'], name='Value'), height=200)
+
+            runs = run_strategies(specs, price_arrays, initial_cash, commission,
+                                  progress=ProgressChannel(), onProgress=show_progress)
+            with closing(runs):
+                for result, chart in runs:
+                    chart = {**chart, 'key': chart_key(spec_by_name[chart['name']], data_digest, initial_cash, commission)}
+                    st.session_state['results'].append(result)
+                    st.session_state['charts'].append(chart)
+                    results_table.table(pd.DataFrame(st.session_state['results']))
+                    live_panels[chart['name']].empty()
         else:
             st.warning("No data available to run the backtest.")
+
+if st.session_state['results']:
+    results_table.table(pd.DataFrame(st.session_state['results']))
+
+# charts are drawn only when asked for, from the downsampled series kept with the results
+charts = [chart for chart in st.session_state['charts'] if chart['series'] is not None]
+if charts:
+    cols = st.columns(2)
+    for i, chart in enumerate(charts):
+        with cols[i % 2]:
+            if st.checkbox(f"Show {chart['name']} chart", key=f"show_chart_{chart['name']}"):
+                st.image(chart_png(chart['key'], chart['series'], chart['name']))
+
+st.header('Monte Carlo')
+st.write('Resample the returns of a completed run to see the range of outcomes it could have had.')
+simulated = [chart for chart in st.session_state['charts'] if chart.get('returns') is not None]
+if simulated:
+    mc_cols = st.columns(4)
+    mc_name = mc_cols[0].selectbox('Run', [chart['name'] for chart in simulated])
+    mc_method = mc_cols[1].selectbox('Method', METHODS)
+    mc_paths = mc_cols[2].number_input('Paths', min_value=100, max_value=100_000, value=PATHS, step=1000)
+    mc_block = mc_cols[3].number_input('Block Size (bars)', min_value=1, max_value=250, value=BLOCK_SIZE)
+    mc_seed = st.number_input('Seed', min_value=0, value=0)
+    if st.button('Run Monte Carlo'):
+        chart = next(chart for chart in simulated if chart['name'] == mc_name)
+        samples = chart['returns'] if mc_method == 'Block bootstrap' else chart['trades']
+        try:
+            simulation = monte_carlo(samples, initial_cash, method=mc_method, paths=int(mc_paths),
+                                     blockSize=int(mc_block), seed=int(mc_seed))
+            st.session_state['monte_carlo'] = (mc_name, mc_method, *confidence_bands(simulation))
+        except ValueError as e:
+            st.warning(f"Could not run Monte Carlo: {e}")
+    if st.session_state['monte_carlo'] is not None:
+        mc_name, mc_method, summary, bands = st.session_state['monte_carlo']
+        st.subheader(f'{mc_name}: {mc_method}')
+        st.table(summary)
+        st.line_chart(bands.rename_axis('Bars' if mc_method == 'Block bootstrap' else 'Trades'))
+else:
+    st.write('Run a backtest first.')
+
+st.header('Batch Backtest')
+st.write('Run the selected strategies over every ticker of a list or of a scraped country, between the dates above.')
+universe = st.selectbox('Universe', universe_sources())
+
+batch_table = st.empty()
+if st.button("Run Batch Backtest") and universe:
+    tickers = load_universe(universe)
+    progress = st.progress(0.0, text=f"0 / {len(tickers)} tickers")
+    st.session_state['batch_results'] = []
+    st.button("Cancel Batch")
+    last_update = 0.0
+    runs = run_universe(tickers, selected_specs(strategies_to_run), initial_cash, commission,
+                        start=st.session_state['start_date'], end=st.session_state['end_date'], progress=ProgressChannel())
+    with closing(runs):
+        for rows, done in runs:
+            st.session_state['batch_results'].extend(rows)
+            progress.progress(done / len(tickers), text=f"{done} / {len(tickers)} tickers")
+            # redrawing a table of thousands of rows on every chunk would dominate, refresh twice a second
+            if time.monotonic() - last_update > 0.5 or done == len(tickers):
+                batch_table.dataframe(pd.DataFrame(st.session_state['batch_results']), use_container_width=True)
+                last_update = time.monotonic()
+
+if st.session_state['batch_results']:
+    batch_results = pd.DataFrame(st.session_state['batch_results'])
+    if 'Return %' in batch_results.columns:
+        batch_results = batch_results.sort_values('Return %', ascending=False, na_position='last')
+    batch_table.dataframe(batch_results, use_container_width=True, hide_index=True)
+    st.download_button('Download results', batch_results.to_csv(index=False), file_name='batch_backtest.csv', mime='text/csv')
@@ -1,12 +1,13 @@
 import streamlit as st
 import pandas as pd
-import yfinance as yf
 import datetime
 import plotly.graph_objects as go
 import numpy as np
 import groq
 import os
 import json
+from tickerSearch import search_tickers
+from cleanData import align_closes, clean_history
 
 # Streamlit page configuration
 st.set_page_config(page_title="CAPM", page_icon="chart_with_upwards_trend", layout='wide')
@@ -87,11 +88,19 @@ st.caption("The Capital Asset Pricing Model (CAPM) is a formula that helps inves
 # Getting input from the user
 col1, col2 = st.columns([1, 1])
 with col1:
+    # the index over both ticker lists loads once per process, searches are sub-millisecond
+    search_query = st.text_input("Search any US or Indian stock by ticker or company name")
+    search_results = search_tickers(search_query, limit=25) if search_query else []
+    searched_stocks = st.multiselect(
+        "Matching stocks",
+        [result['Ticker'] for result in search_results],
+        format_func=lambda ticker: next(f"{r['Ticker']} - {r['Name']} ({r['Exchange']})" for r in search_results if r['Ticker'] == ticker))
     stocks_list = st.multiselect(
         "Choose Stocks by ticker",
         ('AAPL', 'MSFT', 'AMZN', 'NVDA', 'GOOGL', 'TSLA', 'META', 'GOOG', 'BRK', 'UNH', 'XOM', 'JNJ', 'JPM', 'V', 'LLY', 'AVGO', 'PG', 'MA', 'HD', 'MRK', 'CVX', 'PEP', 'COST', 'ABBV', 'KO', 'ADBE', 'WMT', 'MCD', 'CSCO', 'PFE', 'CRM', 'TMO', 'BAC', 'NFLX', 'ACN', 'A', 'DE', 'GS', 'ELV', 'LMT', 'AXP', 'BLK', 'SYK', 'BKNG', 'MDLZ', 'ADI', 'TJX', 'GILD', 'MMC', 'ADP', 'VRTX', 'AMT', 'C', 'CVS', 'LRCX', 'SCHW', 'CI', 'MO', 'ZTS', 'TMUS', 'ETN', 'CB', 'FI',
          'RELIANCE.NS', 'TCS.NS', 'HDFCBANK.NS', 'INFY.NS', 'ICICIBANK.NS', 'KOTAKBANK.NS', 'LT.NS', 'HINDUNILVR.NS', 'SBIN.NS', 'BHARTIARTL.NS', 'AXISBANK.NS', 'ITC.NS', 'BAJFINANCE.NS', 'MARUTI.NS', 'ASIANPAINT.NS', 'SUNPHARMA.NS', 'TATASTEEL.NS', 'ULTRACEMCO.NS', 'M&M.NS', 'WIPRO.NS'),
         ['GOOGL', 'AAPL', 'MSFT', 'TATASTEEL.NS', 'ULTRACEMCO.NS', 'WIPRO.NS'])
+    stocks_list = stocks_list + [stock for stock in searched_stocks if stock not in stocks_list]
 with col2:
     year_list = st.number_input("Number of Years", 1, 25, 10)
 
@@ -100,42 +109,42 @@ try:
     start_date = datetime.date(datetime.date.today().year - year_list, datetime.date.today().month, datetime.date.today().day)
 
     # Get the US and India stocks
-    us_stocks = [stock for stock in stocks_list if not stock.endswith('.NS')]
-    india_stocks = [stock for stock in stocks_list if stock.endswith('.NS')]
+    us_stocks = [stock for stock in stocks_list if not stock.endswith(('.NS', '.BO'))]
+    india_stocks = [stock for stock in stocks_list if stock.endswith(('.NS', '.BO'))]
 
     # Fetch data for US and India stocks separately
-    us_df = pd.DataFrame()
+    us_closes = {}
     for stock in us_stocks:
         try:
-            data = yf.download(stock, period=f'{year_list}y')
-            us_df[f'{stock}'] = data['Close']
+            data = clean_history(stock, period=f'{year_list}y')
+            us_closes[f'{stock}'] = data['Close']
         except Exception as e:
             st.write(f"Error fetching data for {stock}: {e}")
 
-    india_df = pd.DataFrame()
+    india_closes = {}
     for stock in india_stocks:
         try:
-            data = yf.download(stock, period=f'{year_list}y')
-            india_df[f'{stock}'] = data['Close']
+            data = clean_history(stock, period=f'{year_list}y')
+            india_closes[f'{stock}'] = data['Close']
         except Exception as e:
             st.write(f"Error fetching data for {stock}: {e}")
 
     # Add S&P 500 and Nifty 50 data to the respective DataFrames
     try:
-        sp500_data = yf.download('^GSPC', period=f'{year_list}y')
-        us_df['sp500'] = sp500_data['Close']
+        sp500_data = clean_history('^GSPC', period=f'{year_list}y')
+        us_closes['sp500'] = sp500_data['Close']
     except Exception as e:
         st.write(f"Error fetching S&P 500 data: {e}")
 
     try:
-        nifty50_data = yf.download('^NSEI', period=f'{year_list}y')
-        india_df['NIFTY 50'] = nifty50_data['Close']
+        nifty50_data = clean_history('^NSEI', period=f'{year_list}y')
+        india_closes['NIFTY 50'] = nifty50_data['Close']
     except Exception as e:
         st.write(f"Error fetching Nifty 50 data: {e}")
 
-    # Handle missing values
-    us_df = us_df.dropna(subset=[col for col in us_df.columns if col != 'Date'])
-    india_df = india_df.dropna(subset=[col for col in india_df.columns if col != 'Date'])
+    # Align every series on one calendar, fill short gaps and drop rows that are still missing
+    us_df = align_closes(us_closes)
+    india_df = align_closes(india_closes)
 
     # Process the data and calculate CAPM
     us_stocks_daily_return = daily_return(us_df)
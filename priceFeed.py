@@ -0,0 +1,205 @@
+# Compact array-backed price data for the backtester
+#
+# PriceArrays holds one bar series as contiguous numpy columns (int64 nanosecond dates plus
+# float64 OHLCV). load_csv_stream fills it from an uploaded CSV chunk by chunk with fixed
+# dtypes and a date format fixed by the first date, validating the schema as it goes, so a
+# multi-year minute file never exists as more than one chunk of pandas objects at a time.
+
+import hashlib
+import warnings
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+SHARED_FIELDS = ["dates", "open", "high", "low", "close", "volume", "openinterest"]
+REQUIRED_COLUMNS = ["Date", "Open", "High", "Low", "Close", "Volume"]
+OPTIONAL_COLUMNS = ["OpenInterest"]
+PRICE_DTYPES = {"Open": np.float64, "High": np.float64, "Low": np.float64, "Close": np.float64,
+                "Volume": np.float64, "OpenInterest": np.float64}
+
+class PriceArrays:
+    def __init__(self, dates:np.ndarray, open:np.ndarray, high:np.ndarray, low:np.ndarray, close:np.ndarray,
+                 volume:np.ndarray, openinterest:np.ndarray = None, issues:list = None):
+        self.dates = dates
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.openinterest = openinterest if openinterest is not None else np.zeros(len(dates))
+        self.issues = issues or []
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    @property
+    def empty(self) -> bool:
+        return len(self.dates) == 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.dates, self.open, self.high, self.low, self.close, self.volume, self.openinterest))
+
+    def head(self, bars:int) -> "PriceArrays":
+        """The first bars bars, as views of these arrays."""
+        return PriceArrays(self.dates[:bars], self.open[:bars], self.high[:bars], self.low[:bars], self.close[:bars],
+                           self.volume[:bars], self.openinterest[:bars], self.issues)
+
+    def digest(self) -> str:
+        """Content hash of the bars, stable across processes and sessions."""
+        h = hashlib.blake2b(digest_size=16)
+        for a in (self.dates, self.open, self.high, self.low, self.close, self.volume, self.openinterest):
+            h.update(np.ascontiguousarray(a).tobytes())
+        return h.hexdigest()
+
+    @classmethod
+    def from_frame(cls, data:pd.DataFrame) -> "PriceArrays":
+        index = pd.DatetimeIndex(data.index)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        column = lambda name: np.ascontiguousarray(data[name].to_numpy(dtype=np.float64))
+        return cls(index.as_unit("ns").asi8.copy(), column("Open"), column("High"), column("Low"), column("Close"),
+                   column("Volume") if "Volume" in data.columns else np.zeros(len(data)),
+                   column("OpenInterest") if "OpenInterest" in data.columns else None)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            "Open": self.open,
+            "High": self.high,
+            "Low": self.low,
+            "Close": self.close,
+            "Volume": self.volume,
+        }, index=pd.DatetimeIndex(self.dates.view("datetime64[ns]"), name="Date"))
+
+def _date_format(sample:str):
+    # timestamps written by pandas/yfinance carry a UTC offset after the wall-clock time,
+    # the session's wall-clock time is what the backtester wants
+    sample = sample.strip()
+    if sample[:4].isdigit() and sample[4:5] == "-":
+        if len(sample) == 10:
+            return "%Y-%m-%d", 10
+        if len(sample) >= 19 and sample[10] in " T":
+            return f"%Y-%m-%d{sample[10]}%H:%M:%S", 19
+        if len(sample) == 16 and sample[10] in " T":
+            return f"%Y-%m-%d{sample[10]}%H:%M", 16
+        return "ISO8601", None
+    # anything else (01/02/2020, Jan 2 2020, ...) is pandas' guess, None when it has none
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return guess_datetime_format(sample), None
+
+def _day_month_swapped(dateFormat:str):
+    # the other reading of a month/day or day/month format, None when there is no other reading
+    if dateFormat.startswith("%Y") or "%m" not in dateFormat or "%d" not in dateFormat:
+        return None
+    return dateFormat.replace("%m", "\0").replace("%d", "%m").replace("\0", "%d")
+
+def load_csv_stream(source, chunkSize:int = 200_000) -> PriceArrays:
+    """Read a Date/OHLCV CSV in chunks straight into PriceArrays, raising ValueError on a bad schema."""
+    header = pd.read_csv(source, nrows=0).columns.tolist()
+    if hasattr(source, "seek"):
+        source.seek(0)
+    byName = {name.strip().lower(): name for name in header}
+    missing = [name for name in REQUIRED_COLUMNS if name.lower() not in byName]
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {', '.join(missing)}")
+    columns = {byName[name.lower()]: name for name in REQUIRED_COLUMNS + OPTIONAL_COLUMNS if name.lower() in byName}
+
+    parts = {name: [] for name in columns.values()}
+    issues = []
+    dateFormat, dateWidth = None, None
+    lastDate = None
+    ordered = True
+    rowOffset = 0
+    reader = pd.read_csv(source, usecols=list(columns), chunksize=chunkSize,
+                         dtype={original: (str if name == "Date" else PRICE_DTYPES[name]) for original, name in columns.items()})
+    try:
+        for chunk in reader:
+            chunk = chunk.rename(columns=columns)
+            rawDates = chunk["Date"]
+            present = rawDates.dropna()
+            if dateFormat is None and len(present):
+                dateFormat, dateWidth = _date_format(present.iloc[0])
+                if dateFormat is None:
+                    dateFormat = "mixed"
+                    issues.append(f"Could not identify the Date format from {present.iloc[0]!r}, "
+                                  "each date was inferred on its own")
+                elif _day_month_swapped(dateFormat) is not None:
+                    # 01/02/2020 reads either way, keep the order that reads more of the first chunk
+                    readings = [dateFormat, _day_month_swapped(dateFormat)]
+                    counts = [pd.to_datetime(present, format=f, errors="coerce").notna().sum() for f in readings]
+                    dateFormat = readings[int(counts[1] > counts[0])]
+                    if counts[0] == counts[1]:
+                        order = "day/month" if dateFormat.index("%d") < dateFormat.index("%m") else "month/day"
+                        issues.append(f"Dates such as {present.iloc[0]!r} read as day/month and as month/day, "
+                                      f"they were read as {order}")
+            if dateWidth is not None and len(present) and len(present.iloc[0]) > dateWidth:
+                rawDates = rawDates.str.slice(0, dateWidth)
+            try:
+                dates = pd.to_datetime(rawDates, format=dateFormat, errors="coerce")
+            except (ValueError, TypeError) as e:
+                raise ValueError(f"Unparseable Date near row {rowOffset + 1}: {e}") from None
+            parsed = dates.notna().to_numpy()
+            if len(present) and not parsed.any():
+                # not a single date read, the column is in a format this reader does not know
+                raise ValueError(f"Unparseable Date near row {rowOffset + 1}: {present.iloc[0]!r}")
+            if getattr(dates.dt, "tz", None) is not None:
+                dates = dates.dt.tz_localize(None)
+            dates = dates.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+            if not parsed.all():
+                issues.append(f"Dropped {int((~parsed).sum())} rows with a missing or unparseable Date near row {rowOffset + 1}")
+            hasClose = ~np.isnan(chunk["Close"].to_numpy())
+            if not hasClose[parsed].all():
+                issues.append(f"Dropped {int((~hasClose[parsed]).sum())} rows without a Close near row {rowOffset + 1}")
+            valid = parsed & hasClose
+            if valid.any():
+                chunkDates = dates[valid]
+                if np.any(np.diff(chunkDates) < 0) or (lastDate is not None and chunkDates[0] < lastDate):
+                    ordered = False
+                lastDate = chunkDates[-1]
+                parts["Date"].append(chunkDates)
+                for name in columns.values():
+                    if name != "Date":
+                        parts[name].append(chunk[name].to_numpy()[valid])
+            rowOffset += len(chunk)
+    except ValueError as e:
+        if str(e).startswith("Unparseable"):
+            raise
+        raise ValueError(f"Invalid value in price columns near row {rowOffset + 1}: {e}") from None
+
+    if not parts["Date"]:
+        return PriceArrays(np.empty(0, dtype=np.int64), *(np.empty(0) for _ in range(5)), issues=issues)
+    arrays = {name: np.concatenate(values) for name, values in parts.items()}
+    if not ordered:
+        issues.append("Rows were not in date order and have been sorted")
+        order = np.argsort(arrays["Date"], kind="stable")
+        arrays = {name: values[order] for name, values in arrays.items()}
+    duplicated = np.concatenate([arrays["Date"][1:] == arrays["Date"][:-1], [False]])
+    if duplicated.any():
+        issues.append(f"Dropped {int(duplicated.sum())} duplicated timestamps")
+        arrays = {name: values[~duplicated] for name, values in arrays.items()}
+    if np.any(arrays["High"] < arrays["Low"]):
+        issues.append(f"{int((arrays['High'] < arrays['Low']).sum())} bars have High below Low")
+    return PriceArrays(arrays["Date"], arrays["Open"], arrays["High"], arrays["Low"], arrays["Close"],
+                       arrays["Volume"], arrays.get("OpenInterest"), issues)
+
+def share_arrays(arrays:PriceArrays):
+    """Copy arrays into one shared memory block; returns the block and a small picklable descriptor."""
+    length = len(arrays)
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(SHARED_FIELDS) * length * 8))
+    packed = np.ndarray((len(SHARED_FIELDS), length), dtype=np.float64, buffer=block.buf)
+    packed[0] = arrays.dates.view(np.float64)
+    for row, field in enumerate(SHARED_FIELDS[1:], start=1):
+        packed[row] = getattr(arrays, field)
+    del packed
+    return block, (block.name, length)
+
+def attach_arrays(descriptor):
+    """Map a block created by share_arrays; returns the block (keep it open) and zero-copy PriceArrays."""
+    name, length = descriptor
+    block = shared_memory.SharedMemory(name=name)
+    packed = np.ndarray((len(SHARED_FIELDS), length), dtype=np.float64, buffer=block.buf)
+    arrays = PriceArrays(packed[0].view(np.int64), *(packed[row] for row in range(1, len(SHARED_FIELDS))))
+    return block, arrays
@@ -0,0 +1,144 @@
+# Memory-mapped price panel for a whole market
+#
+# build_panel packs every scraped ticker of a country into one float64 array laid out as
+# dates x tickers x fields and writes it next to a calendar (int64 UTC nanoseconds) and a
+# ticker list. load_panel maps the file read-only, so every Streamlit session and worker
+# process on the machine shares the same pages of memory instead of private DataFrames.
+# Batch runs over a scraped universe read their histories from the panel while it is current,
+# that is while nothing in the store has been written since it was built.
+
+import os
+import sys
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from dataStore import SCRAPED_ROOT, get_store
+
+PANEL_ROOT = "data/panels"
+FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+
+_open_panels = {}
+
+class PricePanel:
+    def __init__(self, path:str):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.path = path
+        self.country = meta["country"]
+        self.fields = meta["fields"]
+        self.tickers = meta["tickers"]
+        # panels built before the stamp existed never count as current
+        self.source = meta.get("source")
+        self.columns = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.field_index = {field: i for i, field in enumerate(self.fields)}
+        self.calendar = np.load(os.path.join(path, "dates.npy"), mmap_mode="r")
+        self.dates = pd.DatetimeIndex(pd.to_datetime(np.asarray(self.calendar), utc=True), name="Date")
+        self.values = np.memmap(os.path.join(path, "panel.f64"), dtype=np.float64, mode="r",
+                                shape=(len(self.calendar), len(self.tickers), len(self.fields)))
+
+    def __contains__(self, ticker:str) -> bool:
+        return ticker in self.columns
+
+    def date_range(self, start = None, end = None) -> slice:
+        # the calendar is sorted, so a date window is just two binary searches
+        first = 0 if start is None else int(np.searchsorted(self.calendar, _nanos(start), side="left"))
+        last = len(self.calendar) if end is None else int(np.searchsorted(self.calendar, _nanos(end), side="left"))
+        return slice(first, last)
+
+    def get(self, ticker:str, field:str = "Close", start = None, end = None) -> np.ndarray:
+        """Zero-copy view of one field of one ticker."""
+        return self.values[self.date_range(start, end), self.columns[ticker], self.field_index[field]]
+
+    def field(self, field:str = "Close", tickers:list = None, start = None, end = None) -> np.ndarray:
+        """dates x tickers matrix of one field, a view when tickers is None."""
+        rows = self.date_range(start, end)
+        if tickers is None:
+            return self.values[rows, :, self.field_index[field]]
+        return self.values[rows, [self.columns[t] for t in tickers], self.field_index[field]]
+
+    def frame(self, ticker:str, start = None, end = None) -> pd.DataFrame:
+        """OHLCV DataFrame for one ticker with the rows it has no data for dropped."""
+        rows = self.date_range(start, end)
+        data = pd.DataFrame(self.values[rows, self.columns[ticker], :], index=self.dates[rows], columns=self.fields)
+        return data.dropna(how="all")
+
+    def wide(self, field:str = "Close", tickers:list = None, start = None, end = None) -> pd.DataFrame:
+        rows = self.date_range(start, end)
+        tickers = self.tickers if tickers is None else tickers
+        return pd.DataFrame(self.field(field, tickers, start, end), index=self.dates[rows], columns=tickers)
+
+def _nanos(value) -> int:
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize("UTC")
+    return int(timestamp.tz_convert("UTC").as_unit("ns").value)
+
+def _source_stamp(store, countryName:str) -> list:
+    # every store write replaces a file, which moves the country directory's mtime
+    return [store.extension, os.stat(os.path.join(store.root, countryName)).st_mtime_ns]
+
+def build_panel(countryName:str, backend:str = None, root:str = SCRAPED_ROOT, panelRoot:str = PANEL_ROOT) -> str:
+    store = get_store(backend, root)
+    tickers = store.list_tickers(countryName)
+    if not tickers:
+        return f"No scraped data found for {countryName}"
+    source = _source_stamp(store, countryName)
+
+    # first pass only reads one column per ticker to build the shared calendar
+    calendar = np.unique(np.concatenate([
+        store.read(ticker, countryName, columns=["Close"]).index.asi8 for ticker in tickers]))
+    target = os.path.join(panelRoot, countryName)
+    building = target + ".building"
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+
+    np.save(os.path.join(building, "dates.npy"), calendar)
+    values = np.memmap(os.path.join(building, "panel.f64"), dtype=np.float64, mode="w+",
+                       shape=(len(calendar), len(tickers), len(FIELDS)))
+    values[:] = np.nan
+    # second pass fills one ticker at a time, so memory stays at a single history
+    for column, ticker in enumerate(tickers):
+        data = store.read(ticker, countryName, columns=FIELDS)
+        data = data[~data.index.duplicated(keep="last")]
+        rows = np.searchsorted(calendar, data.index.asi8)
+        values[rows, column, :] = data.reindex(columns=FIELDS).to_numpy(dtype=np.float64)
+    values.flush()
+    del values
+
+    with open(os.path.join(building, "meta.json"), "w") as f:
+        json.dump({"country": countryName, "fields": FIELDS, "tickers": tickers, "source": source}, f)
+
+    # swap the finished panel in so readers never map a half-written file
+    old = target + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(target):
+        os.replace(target, old)
+    os.replace(building, target)
+    shutil.rmtree(old, ignore_errors=True)
+    _open_panels.pop(target, None)
+    return f"Built {countryName} panel with {len(calendar)} dates x {len(tickers)} tickers"
+
+def load_panel(countryName:str, panelRoot:str = PANEL_ROOT) -> PricePanel:
+    """Open (once per process) the read-only panel for a country."""
+    path = os.path.join(panelRoot, countryName)
+    if path not in _open_panels:
+        _open_panels[path] = PricePanel(path)
+    return _open_panels[path]
+
+def current_panel(countryName:str, backend:str = None, root:str = SCRAPED_ROOT, panelRoot:str = PANEL_ROOT) -> PricePanel:
+    """The country's panel if it was built from the store as it is now, else None."""
+    path = os.path.join(panelRoot, countryName)
+    store = get_store(backend, root)
+    if not os.path.exists(os.path.join(path, "meta.json")) or not os.path.isdir(os.path.join(store.root, countryName)):
+        return None
+    source = _source_stamp(store, countryName)
+    if load_panel(countryName, panelRoot).source != source:
+        # another process may have rebuilt the panel since this one opened it
+        _open_panels.pop(path, None)
+    panel = load_panel(countryName, panelRoot)
+    return panel if panel.source == source else None
+
+if __name__ == "__main__":
+    for country in sys.argv[1:] or ["US", "IND"]:
+        print(build_panel(country))
@@ -1,48 +1,53 @@
+import os
+import sys
+import time
 import streamlit as st
 import pandas as pd
-import backtrader as bt
-import yfinance as yf
-import inspect
-
-# Define Strategies (reuse from backtest_page.py or import them)
-class MovingAverageCrossover(bt.Strategy):
-    params = (
-        ('short_period', 10),
-        ('long_period', 50),
-    )
-
-    def __init__(self):
-        self.short_ma = bt.indicators.SimpleMovingAverage(self.data.close, period=self.params.short_period)
-        self.long_ma = bt.indicators.SimpleMovingAverage(self.data.close, period=self.params.long_period)
-        self.crossover = bt.indicators.CrossOver(self.short_ma, self.long_ma)
-
-    def next(self):
-        if self.crossover > 0:
-            self.buy()
-        elif self.crossover < 0:
-            self.sell()
+from contextlib import closing
+# prototypes are run directly with streamlit, make the shared modules in the repo root importable
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cleanData import clean_history
+from priceFeed import PriceArrays, load_csv_stream
+from walkForward import METRICS, parameter_grid, walk_forward
+from optimizer import genetic_search, grid_search, parameter_space, successive_halving
+from runProgress import ProgressChannel
+from studyStore import get_study_store, point_key
+
+from strategies import BUILTIN_STRATEGIES, MovingAverageCrossover
 
 # Initialize session state variables
 def initialize_optimize_session():
     if 'strategies' not in st.session_state:
         st.session_state['strategies'] = [MovingAverageCrossover]
-    if 'data' not in st.session_state:
-        st.session_state['data'] = None
+    if 'price_arrays' not in st.session_state:
+        # prices are kept as compact arrays, a DataFrame is only built where one is needed
+        st.session_state['price_arrays'] = None
     if 'optimize_results' not in st.session_state:
         st.session_state['optimize_results'] = []
+    if 'walk_forward' not in st.session_state:
+        st.session_state['walk_forward'] = None
+    if 'genetic_results' not in st.session_state:
+        st.session_state['genetic_results'] = None
 
 initialize_optimize_session()
 
-def optimize_strategy(strategy, data_feed, initial_cash, commission, opt_params):
-    cerebro = bt.Cerebro(optreturn=False)
-    cerebro.adddata(data_feed)
-    cerebro.optstrategy(strategy, **opt_params)
-    cerebro.broker.set_cash(initial_cash)
-    cerebro.broker.setcommission(commission=commission)
-    
-    results = cerebro.run()
-    
-    return results
+def optimize_strategy(strategy, price_arrays, initial_cash, commission, opt_params, on_chunk=None, study=None):
+    """Records of every grid point, run in chunks on the worker pool; on_chunk(done, total, skipped) after each.
+
+    With a study, points it already holds are read back instead of being run again.
+    """
+    points = parameter_grid(opt_params)
+    records = study.evaluated() if study is not None else {}
+    skipped = sum(point_key(params) in records for params in points)
+    runs = grid_search(strategy, price_arrays, opt_params, initial_cash, commission, progress=ProgressChannel(), study=study)
+    with closing(runs):
+        for chunk, done in runs:
+            # failed points are not kept in the study, their Error records come from the run
+            records.update((point_key({name: record[name] for name in opt_params}), record) for record in chunk)
+            if on_chunk is not None:
+                on_chunk(done, len(points), skipped)
+    # a cancelled run leaves some points out
+    return [records[point_key(params)] for params in points if point_key(params) in records]
 
 st.title('Optimizer')
 
@@ -55,6 +60,9 @@ st.session_state['end_date'] = st.date_input('End Date', pd.to_datetime('2021-12
 
 uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
 
+def study_label():
+    return uploaded_file.name if uploaded_file else st.session_state['ticker']
+
 initial_cash = st.number_input('Initial Cash', value=10000)
 commission = st.number_input('Broker Commission', value=0.001)
 
@@ -70,34 +78,169 @@ opt_params = {
     'long_period': range(long_period[0], long_period[1] + 1)
 }
 
-if st.button("Run Optimization"):
+search_mode = st.radio('Search', ['Full grid', 'Successive halving'], horizontal=True,
+                       help='Successive halving runs every combination on the first part of the history and only '
+                            'the best third on the rest. Either mode reuses the combinations earlier runs on the '
+                            'same data and settings already finished on the whole history.')
+
+def load_data():
     if not uploaded_file and not st.session_state['ticker']:
         st.warning("Please provide a ticker symbol or upload a CSV file with historical data.")
+        return False
+    if uploaded_file:
+        try:
+            price_arrays = load_csv_stream(uploaded_file)
+            for issue in price_arrays.issues:
+                st.info(issue)
+            st.session_state['price_arrays'] = price_arrays
+        except ValueError as e:
+            st.warning(f"Could not load the CSV file: {e}")
+            st.session_state['price_arrays'] = None
     else:
-        if uploaded_file:
-            st.session_state['data'] = pd.read_csv(uploaded_file, index_col='Date', parse_dates=True)
-        else:
-            st.session_state['data'] = yf.download(st.session_state['ticker'], start=st.session_state['start_date'], end=st.session_state['end_date'])
-
-        if st.session_state['data'] is not None and not st.session_state['data'].empty:
-            data_feed = bt.feeds.PandasData(dataname=st.session_state['data'])
+        history = clean_history(st.session_state['ticker'], start=st.session_state['start_date'], end=st.session_state['end_date'])
+        st.session_state['price_arrays'] = None if history.empty else PriceArrays.from_frame(history)
+    return True
 
+if st.button("Run Optimization"):
+    if load_data():
+        if st.session_state['price_arrays'] is not None and not st.session_state['price_arrays'].empty:
             strategy_class = next(strat for strat in st.session_state['strategies'] if strat.__name__ == strategy_to_optimize)
-            optimize_results = optimize_strategy(strategy_class, data_feed, initial_cash, commission, opt_params)
+            progress = st.progress(0.0, text="Starting")
+            # any click while this runs reruns the page, which closes the search and cancels it
+            st.button("Cancel Optimization")
+            started = time.monotonic()
+
+            def show_progress(done, total, skipped):
+                elapsed = time.monotonic() - started
+                # points read back from the study took no time, the rate is that of the new ones
+                eta = elapsed / max(1, done - skipped) * (total - done)
+                progress.progress(done / total, text=f"{done} / {total} combinations ({skipped} from earlier runs), "
+                                                     f"about {eta:.0f}s left")
+
+            price_arrays = st.session_state['price_arrays']
+            # results are kept per strategy, data, cash and commission, a rerun resumes where the last one stopped
+            study = get_study_store().study(strategy_class, price_arrays.digest(), initial_cash, commission, study_label())
+            if search_mode == 'Full grid':
+                records = optimize_strategy(strategy_class, price_arrays, initial_cash, commission, opt_params, show_progress,
+                                            study)
+            else:
+                records = []
+                rungs = successive_halving(strategy_class, price_arrays, parameter_grid(opt_params), initial_cash, commission,
+                                           study=study)
+                with closing(rungs):
+                    for rung, bars, records in rungs:
+                        progress.progress(bars / len(price_arrays),
+                                          text=f"{len(records)} combinations ranked on {bars} / {len(price_arrays)} bars")
 
             # Process and display optimization results
-            st.session_state['optimize_results'] = []
-            for res in optimize_results:
-                for strategy in res:
-                    st.session_state['optimize_results'].append({
-                        'Short Period': strategy.params.short_period,
-                        'Long Period': strategy.params.long_period,
-                        'Ending Value': strategy.broker.getvalue()
-                    })
-
-            results_df = pd.DataFrame(st.session_state['optimize_results'])
-            st.write(results_df)
-            st.line_chart(results_df.set_index(['Short Period', 'Long Period'])['Ending Value'])
+            st.session_state['optimize_results'] = [
+                {'Short Period': record.pop('short_period'), 'Long Period': record.pop('long_period'), **record}
+                for record in records]
+        else:
+            st.warning("No data available to run the optimization.")
+
+if st.session_state['optimize_results']:
+    results_df = pd.DataFrame(st.session_state['optimize_results']).sort_values(['Short Period', 'Long Period'])
+    st.write(results_df)
+    if 'Ending Value' in results_df.columns:
+        st.line_chart(results_df.set_index(['Short Period', 'Long Period'])['Ending Value'])
+
+st.header('Walk-Forward Optimization')
+st.write('Optimize on a rolling train window, trade the winner on the following test window and chain the test windows together.')
+train_years = st.slider('Train Window (years)', min_value=1, max_value=10, value=3)
+test_years = st.slider('Test Window (years)', min_value=1, max_value=5, value=1)
+walk_forward_metric = st.selectbox('Optimize For', list(METRICS))
+
+if st.button("Run Walk-Forward"):
+    if load_data():
+        if st.session_state['price_arrays'] is not None and not st.session_state['price_arrays'].empty:
+            strategy_class = next(strat for strat in st.session_state['strategies'] if strat.__name__ == strategy_to_optimize)
+            # 252 trading days a year
+            try:
+                st.session_state['walk_forward'] = walk_forward(strategy_class, st.session_state['price_arrays'], opt_params,
+                                                                train_years * 252, test_years * 252, initial_cash, commission,
+                                                                metric=walk_forward_metric)
+            except ValueError as e:
+                st.warning(str(e))
+                st.session_state['walk_forward'] = None
+        else:
+            st.warning("No data available to run the walk-forward optimization.")
+
+if st.session_state['walk_forward'] is not None:
+    windows, equity = st.session_state['walk_forward']
+    st.write(windows)
+    st.line_chart(equity)
+
+st.header('Genetic Optimization')
+st.write('Evolve the parameters of any strategy instead of running every combination.')
+genetic_strategy_name = st.selectbox('Strategy', [strat.__name__ for strat in BUILTIN_STRATEGIES])
+genetic_strategy = next(strat for strat in BUILTIN_STRATEGIES if strat.__name__ == genetic_strategy_name)
+genetic_space = {}
+space_cols = st.columns(3)
+for i, (name, (low, high)) in enumerate(parameter_space(genetic_strategy).items()):
+    with space_cols[i % 3]:
+        if isinstance(low, int):
+            genetic_space[name] = st.slider(name, min_value=1, max_value=max(high * 2, 10), value=(low, high))
+        else:
+            genetic_space[name] = st.slider(name, min_value=0.0, max_value=float(high * 2), value=(float(low), float(high)))
+ga_cols = st.columns(4)
+ga_population = ga_cols[0].number_input('Population', min_value=4, max_value=500, value=24)
+ga_generations = ga_cols[1].number_input('Generations', min_value=1, max_value=200, value=15)
+ga_mutation = ga_cols[2].slider('Mutation Rate', min_value=0.0, max_value=1.0, value=0.2)
+ga_crossover = ga_cols[3].slider('Crossover Rate', min_value=0.0, max_value=1.0, value=0.7)
+ga_cols = st.columns(3)
+ga_elitism = ga_cols[0].number_input('Elite Members', min_value=0, max_value=50, value=2)
+ga_seed = ga_cols[1].number_input('Seed', min_value=0, value=0)
+ga_metric = ga_cols[2].selectbox('Maximize', ['Ending Value', 'Sharpe', 'Sortino', 'CAGR %'])
+
+if st.button("Run Genetic Optimization"):
+    if load_data():
+        if st.session_state['price_arrays'] is not None and not st.session_state['price_arrays'].empty:
+            progress = st.progress(0.0, text="Starting")
+            # any click while this runs reruns the page, which closes the search and cancels it
+            st.button("Cancel Genetic Optimization")
+            try:
+                price_arrays = st.session_state['price_arrays']
+                study = get_study_store().study(genetic_strategy, price_arrays.digest(), initial_cash, commission, study_label())
+                search = genetic_search(genetic_strategy, price_arrays, genetic_space,
+                                        initial_cash, commission, population=int(ga_population),
+                                        generations=int(ga_generations), mutation=ga_mutation, crossover=ga_crossover,
+                                        elitism=int(ga_elitism), metric=ga_metric, seed=int(ga_seed), study=study)
+                history, evaluated = [], {}
+                with closing(search):
+                    for generation, evaluated, best in search:
+                        history.append({'Generation': generation + 1, f'Best {ga_metric}': best.get(ga_metric),
+                                        'Evaluations': len(evaluated)})
+                        progress.progress((generation + 1) / ga_generations,
+                                          text=f"Generation {generation + 1} / {ga_generations}, {len(evaluated)} evaluations")
+                st.session_state['genetic_results'] = (ga_metric, pd.DataFrame(history), pd.DataFrame(list(evaluated.values())))
+            except ValueError as e:
+                st.warning(str(e))
         else:
             st.warning("No data available to run the optimization.")
 
+if st.session_state['genetic_results'] is not None:
+    metric, history, evaluated = st.session_state['genetic_results']
+    st.line_chart(history.set_index('Generation')[f'Best {metric}'])
+    if metric in evaluated.columns:
+        evaluated = evaluated.sort_values(metric, ascending=False, na_position='last')
+    st.write(evaluated)
+
+st.header('Past Studies')
+st.write('Every optimization run is stored with its data and settings and can be viewed here without rerunning it.')
+studies = get_study_store().studies()
+if studies.empty:
+    st.write('No studies yet.')
+else:
+    st.dataframe(studies, use_container_width=True, hide_index=True)
+    study_names = {row.Study: f"{row.Study}: {row.Strategy} on {row.Label or row.Data[:12]}" for row in studies.itertuples()}
+    study_id = st.selectbox('Study', list(study_names), format_func=study_names.get)
+    past = get_study_store().study_frame(study_id)
+    if not past.empty:
+        metrics = [column for column in past.columns if column != 'Error' and pd.api.types.is_numeric_dtype(past[column])]
+        plot_cols = st.columns(3)
+        x_axis = plot_cols[0].selectbox('X', metrics, index=0)
+        y_axis = plot_cols[1].selectbox('Y', metrics, index=metrics.index('Ending Value') if 'Ending Value' in metrics else 0)
+        color = plot_cols[2].selectbox('Color', [None] + metrics)
+        st.scatter_chart(past, x=x_axis, y=y_axis, color=color)
+        st.write(past.sort_values(y_axis, ascending=False))
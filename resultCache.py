@@ -0,0 +1,154 @@
+# Content-addressed cache of backtest results
+#
+# A result is keyed by a hash of everything that determines it: the price data digest, the
+# strategy's source code and parameters, cash, commission and the backtrader version. Editing
+# an uploaded strategy changes its source and therefore its key, so stale results are never
+# served. Entries live in a small in-process LRU in front of a size-bounded directory of
+# pickles shared by every session and server process; the least recently used files are
+# evicted once the directory grows past maxBytes. Values handed out are copies, so callers can
+# annotate them without changing the cached entry. The directory size is tracked from this
+# process's own writes and rescanned every SCAN_EVERY puts to pick up the other processes'.
+
+import os
+import copy
+import pickle
+import hashlib
+import inspect
+import threading
+import backtrader as bt
+from cachetools import LRUCache
+
+CACHE_ROOT = "data/cache/results"
+CACHE_VERSION = 3
+SCAN_EVERY = 64
+
+def strategy_source(spec):
+    """Source code of a strategy spec, or None when it cannot be recovered."""
+    if isinstance(spec, dict):
+        return spec["source"]
+    try:
+        return inspect.getsource(spec)
+    except (OSError, TypeError):
+        return None
+
+def result_key(spec, digest:str, initial_cash, commission, params:dict = None, **options):
+    """Hex key of one backtest, or None for a strategy whose source is unknown."""
+    source = strategy_source(spec)
+    if source is None:
+        return None
+    if isinstance(spec, dict):
+        name = spec["name"]
+    else:
+        # inherited parameter defaults are not in the class source
+        name, params = spec.__name__, {**dict(spec.params._getpairs()), **(params or {})}
+    parts = (CACHE_VERSION, bt.__version__, digest, name, source, sorted((params or {}).items()),
+             float(initial_cash), float(commission), sorted(options.items()))
+    return hashlib.blake2b(repr(parts).encode(), digest_size=20).hexdigest()
+
+class ResultCache:
+    def __init__(self, root:str = CACHE_ROOT, maxBytes:int = 256 * 1024 * 1024, memoryEntries:int = 256):
+        self.root = root
+        self.maxBytes = maxBytes
+        self._memory = LRUCache(maxsize=memoryEntries)
+        self._lock = threading.Lock()
+        # bytes in the directory as of the last scan plus this process's writes since
+        self._bytes = None
+        self._puts = 0
+
+    def path(self, key:str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.pkl")
+
+    def get(self, key:str):
+        """Cached value for key, or None."""
+        if key is None:
+            return None
+        with self._lock:
+            if key in self._memory:
+                return copy.deepcopy(self._memory[key])
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            # the file's mtime is its last use, that is what eviction orders by
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            self._remove(path)
+            return None
+        with self._lock:
+            self._memory[key] = copy.deepcopy(value)
+        return value
+
+    def put(self, key:str, value):
+        if key is None:
+            return
+        with self._lock:
+            self._memory[key] = copy.deepcopy(value)
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmpPath = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmpPath, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = f.tell()
+        os.replace(tmpPath, path)
+        with self._lock:
+            self._puts += 1
+            scan = self._bytes is None or self._puts % SCAN_EVERY == 0
+            if not scan:
+                self._bytes += size
+            over = scan or self._bytes > self.maxBytes
+        if over:
+            self.evict()
+
+    def _remove(self, path:str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _entries(self) -> list:
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for shard in os.scandir(self.root):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith(".pkl"):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Delete least recently used files until the directory fits in maxBytes."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.maxBytes:
+            for _, size, path in sorted(entries):
+                self._remove(path)
+                total -= size
+                if total <= self.maxBytes:
+                    break
+        with self._lock:
+            self._bytes = total
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._bytes = None
+        for _, _, path in self._entries():
+            self._remove(path)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_result_cache() -> ResultCache:
+    """Process-wide result cache so every page and session shares the memory tier."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
@@ -0,0 +1,85 @@
+# Live progress from backtests running in worker processes
+#
+# A ProgressChannel is a queue plus a cancel flag served by one process-wide manager, so it
+# can be handed to pool workers with the task arguments. The ProgressReporter analyzer posts
+# bar count, trade count and portfolio value a fixed number of times per run, which is what
+# the pages draw partial equity curves from, and raises RunCancelled at the next report once
+# the channel has been cancelled, so an abandoned run stops within a few bars.
+
+import queue
+import threading
+import multiprocessing
+import backtrader as bt
+
+UPDATES_PER_RUN = 50
+
+class RunCancelled(Exception):
+    pass
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_manager():
+    """Process-wide manager serving the channels' queues and events."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = multiprocessing.get_context("spawn").Manager()
+        return _manager
+
+class ProgressChannel:
+    def __init__(self):
+        manager = get_manager()
+        self.queue = manager.Queue()
+        self.cancelled = manager.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self.cancelled.is_set()
+
+    def put(self, event:dict):
+        self.queue.put(event)
+
+    def drain(self) -> list:
+        """Every event posted since the last drain, without blocking."""
+        events = []
+        while True:
+            try:
+                events.append(self.queue.get_nowait())
+            except queue.Empty:
+                return events
+
+class ProgressReporter(bt.Analyzer):
+    params = (
+        ('channel', None),
+        ('task', None),
+        ('updates', UPDATES_PER_RUN),
+    )
+
+    def start(self):
+        # with preloaded data the buffer already holds every bar of the run
+        self.total = self.data.buflen()
+        self.every = max(1, self.total // self.p.updates)
+        self.bars = 0
+        self.trades = 0
+
+    def notify_trade(self, trade):
+        if trade.isclosed:
+            self.trades += 1
+
+    def next(self):
+        self.bars += 1
+        if self.bars % self.every and self.bars != self.total:
+            return
+        if self.p.channel.is_cancelled():
+            raise RunCancelled(f"{self.p.task} was cancelled")
+        self.p.channel.put({
+            'task': self.p.task,
+            'bars': self.bars,
+            'total': self.total if self.total >= self.bars else None,
+            'trades': self.trades,
+            'date': self.data.datetime.datetime(0),
+            'value': self.strategy.broker.getvalue(),
+        })
@@ -0,0 +1,75 @@
+# Built-in strategies shared by the Backtester page, the optimizer and the worker processes
+#
+# Indicators come from arrayFeed: precomputed and shared on an ArrayData feed, the regular
+# backtrader indicators on any other feed.
+import backtrader as bt
+import arrayFeed
+
+class MovingAverageCrossover(bt.Strategy):
+    params = (
+        ('short_period', 10),
+        ('long_period', 50),
+    )
+
+    def __init__(self):
+        self.short_ma = arrayFeed.SMA(self.data, period=self.params.short_period)
+        self.long_ma = arrayFeed.SMA(self.data, period=self.params.long_period)
+        self.crossover = bt.indicators.CrossOver(self.short_ma, self.long_ma)
+
+    def next(self):
+        if self.crossover > 0:
+            self.buy()
+        elif self.crossover < 0:
+            self.sell()
+
+class RSIStrategy(bt.Strategy):
+    params = (
+        ('rsi_period', 14),
+        ('overbought', 70),
+        ('oversold', 30),
+    )
+
+    def __init__(self):
+        self.rsi = arrayFeed.RSI(self.data, period=self.params.rsi_period)
+
+    def next(self):
+        if self.rsi < self.params.oversold:
+            self.buy()
+        elif self.rsi > self.params.overbought:
+            self.sell()
+
+class BollingerBandsStrategy(bt.Strategy):
+    params = (
+        ('period', 20),
+        ('devfactor', 2),
+    )
+
+    def __init__(self):
+        self.bollinger = arrayFeed.BollingerBands(self.data, period=self.params.period, devfactor=self.params.devfactor)
+
+    def next(self):
+        if self.data.close < self.bollinger.lines.bot:
+            self.buy()
+        elif self.data.close > self.bollinger.lines.top:
+            self.sell()
+
+class MACDStrategy(bt.Strategy):
+    params = (
+        ('fast_ema', 12),
+        ('slow_ema', 26),
+        ('signal', 9),
+    )
+
+    def __init__(self):
+        self.macd = arrayFeed.MACD(self.data, 
+                                       period_me1=self.params.fast_ema, 
+                                       period_me2=self.params.slow_ema, 
+                                       period_signal=self.params.signal)
+
+    def next(self):
+        if self.macd.macd > self.macd.signal:
+            self.buy()
+        elif self.macd.macd < self.macd.signal:
+            self.sell()
+
+BUILTIN_STRATEGIES = [MovingAverageCrossover, RSIStrategy, BollingerBandsStrategy, MACDStrategy]
@@ -0,0 +1,237 @@
+# Registry and isolated worker pool for user-uploaded strategies
+#
+# Uploaded strategy code is never executed in the Streamlit server. register_source only
+# parses it to find the bt.Strategy subclasses and files it under the hash of its source;
+# the classes are built inside sandbox workers, once per worker and source hash. Sandbox
+# workers are a separate pool, started and warmed up ahead of the first run, with an address
+# space limit for the whole worker and a CPU-time budget per task, so a runaway strategy
+# fails on its own instead of stalling the server or the built-in strategy workers. A task
+# that runs past its budget gets a StrategyTimeout, which strategy code catching Exception
+# cannot swallow, and a finite hard limit a few seconds later, at which the kernel kills the
+# worker; the pool is replaced after any timeout, and tasks queued on it move to the new one.
+
+import os
+import ast
+import signal
+import hashlib
+import resource
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+CPU_SECONDS = 120
+# CPU seconds a timed-out task gets to unwind before the kernel kills its worker
+GRACE_SECONDS = 2
+MEMORY_BYTES = 2 * 1024 ** 3
+# BLAS thread pools reserve address space per thread, workers run one thread each
+THREAD_VARIABLES = ["OPENBLAS_NUM_THREADS", "OMP_NUM_THREADS", "MKL_NUM_THREADS"]
+STRATEGY_FILES = ["additional_strat.txt"]
+
+class StrategyTimeout(BaseException):
+    # raised inside the strategy, a BaseException so that `except Exception` in its code lets it through
+    pass
+
+class SandboxTimeout(TimeoutError):
+    """What the server sees of a StrategyTimeout."""
+
+class SandboxRetired(Exception):
+    """A task reached a worker an earlier timeout left without CPU time, it runs again on a fresh pool."""
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+def source_hash(source:str) -> str:
+    return hashlib.sha256(source.encode()).hexdigest()
+
+def _is_strategy_base(base) -> bool:
+    # bt.Strategy, backtrader.Strategy, Strategy, or bt.SignalStrategy and friends
+    name = base.attr if isinstance(base, ast.Attribute) else getattr(base, "id", "")
+    return name.endswith("Strategy")
+
+def strategy_classes(source:str) -> list:
+    """Names of the top-level strategy classes in source; raises SyntaxError on bad code."""
+    tree = ast.parse(source)
+    names = [node.name for node in tree.body if isinstance(node, ast.ClassDef)]
+    # subclasses of classes defined earlier in the same source count too
+    strategies = []
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and any(_is_strategy_base(base) or getattr(base, "id", None) in strategies
+                                                  for base in node.bases):
+            strategies.append(node.name)
+    return [name for name in names if name in strategies]
+
+def _builtin_names() -> set:
+    # imported here, sandbox workers load this module before their limits are set
+    from strategies import BUILTIN_STRATEGIES
+    return {strategy.__name__ for strategy in BUILTIN_STRATEGIES}
+
+def register_source(source:str) -> list:
+    """Register uploaded code by content hash; returns the specs of its strategy classes.
+
+    Raises ValueError on a class named like a built-in strategy, which would be routed to the
+    built-in code by name instead of running its own.
+    """
+    names = strategy_classes(source)
+    taken = sorted(set(names) & _builtin_names())
+    if taken:
+        raise ValueError(f"{', '.join(taken)} is the name of a built-in strategy, rename the class")
+    digest = source_hash(source)
+    with _registry_lock:
+        _registry[digest] = {"source": source, "names": names}
+    return [{"name": name, "source": source, "hash": digest} for name in names]
+
+def load_strategy_file(path:str) -> list:
+    with open(path) as f:
+        return register_source(f.read())
+
+def load_strategy_files(paths:list = STRATEGY_FILES) -> list:
+    """Specs from every strategy file that exists, skipping files that do not parse or reuse built-in names."""
+    specs = []
+    for path in paths:
+        if os.path.exists(path):
+            try:
+                specs += load_strategy_file(path)
+            except (SyntaxError, ValueError):
+                continue
+    return specs
+
+# --- inside sandbox workers ---
+
+_compiled = {}
+_retired = False
+
+def compiled_strategy(spec):
+    """Strategy class of an uploaded spec, executed once per worker and source hash."""
+    import backtrader as bt
+    digest = spec.get("hash") or source_hash(spec["source"])
+    if digest not in _compiled:
+        namespace = {"bt": bt}
+        exec(compile(spec["source"], f"<strategy {digest[:12]}>", "exec"), namespace)
+        _compiled[digest] = namespace
+    return _compiled[digest][spec["name"]]
+
+def _cpu_exceeded(signum, frame):
+    # a hard limit can not be raised again, from here on the worker is only good for unwinding this task
+    global _retired
+    _retired = True
+    soft, _ = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, soft + GRACE_SECONDS))
+    raise StrategyTimeout("Strategy exceeded its CPU time limit")
+
+def _address_space() -> int:
+    # VmSize of this process, what RLIMIT_AS is checked against
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmSize:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+def _init_worker(memoryBytes:int):
+    for variable in THREAD_VARIABLES:
+        os.environ.setdefault(variable, "1")
+    if memoryBytes:
+        # on top of what the interpreter and anything imported with it already reserved
+        try:
+            limit = _address_space() + memoryBytes
+        except OSError:
+            limit = memoryBytes
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    # the kernel sends SIGXCPU at the soft limit, turn it into an exception in the running task
+    signal.signal(signal.SIGXCPU, _cpu_exceeded)
+    import backtrader
+
+def _warm():
+    return os.getpid()
+
+def sandboxed(function, cpuSeconds, *args):
+    """Run function(*args) in a sandbox worker with at most cpuSeconds of CPU time."""
+    if _retired:
+        raise SandboxRetired("Sandbox worker has no CPU time left")
+    used = resource.getrusage(resource.RUSAGE_SELF)
+    spent = used.ru_utime + used.ru_stime
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    # RLIMIT_CPU counts the worker's whole life, so the budget is added to what it already used
+    limit = int(spent + cpuSeconds) + 1
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+    try:
+        return function(*args)
+    except StrategyTimeout as e:
+        raise SandboxTimeout(str(e)) from None
+    except MemoryError:
+        raise MemoryError("Strategy exceeded its memory limit") from None
+    finally:
+        # after a timeout the hard limit is the one _cpu_exceeded lowered, the pool retires the worker
+        _, current = resource.getrlimit(resource.RLIMIT_CPU)
+        resource.setrlimit(resource.RLIMIT_CPU, (current, current))
+
+# --- in the server ---
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_sandbox_pool(maxWorkers:int = None, memoryBytes:int = MEMORY_BYTES) -> ProcessPoolExecutor:
+    """Process-wide sandbox pool, started and warmed up once."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = maxWorkers or os.cpu_count()
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_init_worker, initargs=(memoryBytes,))
+            # start every worker now so the first upload does not pay for interpreter start-up
+            for _ in range(workers):
+                _pool.submit(_warm)
+        return _pool
+
+def _retire(pool:ProcessPoolExecutor):
+    # the next submit starts a fresh pool; tasks still queued on this one would land on a worker
+    # that has no CPU time left, they are cancelled and submit_sandboxed resubmits them
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def submit_sandboxed(function, *args, cpuSeconds:int = None) -> Future:
+    """Submit to the sandbox pool, replacing it if a worker was killed outright or timed out.
+
+    The returned future outlives the pool: a task that pool replacement cancelled, or that a
+    spent worker turned away, is submitted again to the new pool.
+    """
+    cpuSeconds = cpuSeconds or CPU_SECONDS
+    result = Future()
+    current = []
+
+    def attempt():
+        pool = get_sandbox_pool()
+        try:
+            future = pool.submit(sandboxed, function, cpuSeconds, *args)
+        except RuntimeError:
+            # broken, or shut down by another task's timeout since get_sandbox_pool returned it
+            _retire(pool)
+            pool = get_sandbox_pool()
+            future = pool.submit(sandboxed, function, cpuSeconds, *args)
+        current[:] = [future]
+
+        def settle(done):
+            if done.cancelled() or isinstance(done.exception(), SandboxRetired):
+                if not result.cancelled():
+                    attempt()
+                return
+            error = done.exception()
+            if isinstance(error, (SandboxTimeout, BrokenProcessPool)):
+                _retire(pool)
+            if result.set_running_or_notify_cancel():
+                if error is None:
+                    result.set_result(done.result())
+                else:
+                    result.set_exception(error)
+
+        future.add_done_callback(settle)
+
+    # cancelling the returned future cancels the attempt if it has not started yet
+    result.add_done_callback(lambda done: done.cancelled() and current[-1].cancel())
+    attempt()
+    return result
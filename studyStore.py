@@ -0,0 +1,150 @@
+# Persistent optimization studies in a local SQLite database
+#
+# A study is one strategy (by name and source hash) on one price series (by digest) with one
+# cash and commission setting, under one resultCache.CACHE_VERSION; every optimizer run with
+# the same settings adds to the same study, whatever its search method. Bumping the version
+# when the engine or the metrics change starts fresh studies, the old ones stay viewable.
+# Each evaluated parameter point is stored as soon as its chunk finishes, keyed by its
+# canonical JSON, with the record of metrics it produced. Runs skip points their study
+# already holds, so an interrupted sweep resumes where it stopped and an extended grid only
+# evaluates the new points.
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import closing
+import numpy as np
+import pandas as pd
+from resultCache import CACHE_VERSION, strategy_source
+from strategySandbox import source_hash
+
+STUDY_PATH = "data/studies/studies.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS studies (
+    id INTEGER PRIMARY KEY,
+    strategy TEXT NOT NULL,
+    source_hash TEXT NOT NULL,
+    data_digest TEXT NOT NULL,
+    initial_cash REAL NOT NULL,
+    commission REAL NOT NULL,
+    version INTEGER NOT NULL,
+    label TEXT,
+    created REAL NOT NULL,
+    UNIQUE (strategy, source_hash, data_digest, initial_cash, commission, version)
+);
+CREATE TABLE IF NOT EXISTS points (
+    study_id INTEGER NOT NULL REFERENCES studies (id),
+    params TEXT NOT NULL,
+    record TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (study_id, params)
+);
+"""
+
+def _plain(value):
+    # numpy scalars from the metric tables are not JSON serializable
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def point_key(params:dict) -> str:
+    """Canonical JSON of a parameter point."""
+    return json.dumps({name: _plain(value) for name, value in params.items()}, sort_keys=True)
+
+class StudyStore:
+    def __init__(self, path:str = STUDY_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # one short-lived connection per call, Streamlit sessions run on different threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def study(self, spec, digest:str, initial_cash, commission, label:str = None) -> "Study":
+        """The study of spec on the prices with digest, created on first use."""
+        name = spec["name"] if isinstance(spec, dict) else spec.__name__
+        source = strategy_source(spec)
+        sourceHash = source_hash(source) if source is not None else ""
+        key = (name, sourceHash, digest, float(initial_cash), float(commission), CACHE_VERSION)
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO studies (strategy, source_hash, data_digest, initial_cash, "
+                "commission, version, label, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, label, time.time()))
+            studyId = connection.execute(
+                "SELECT id FROM studies WHERE strategy = ? AND source_hash = ? AND data_digest = ? "
+                "AND initial_cash = ? AND commission = ? AND version = ?", key).fetchone()[0]
+        return Study(self, studyId)
+
+    def studies(self) -> pd.DataFrame:
+        """Every study with its number of evaluated points, newest first."""
+        with closing(self._connect()) as connection:
+            return pd.read_sql_query(
+                "SELECT s.id AS 'Study', s.strategy AS 'Strategy', s.label AS 'Label', "
+                "s.data_digest AS 'Data', s.initial_cash AS 'Initial Cash', "
+                "s.commission AS 'Commission', s.version AS 'Version', "
+                "COUNT(p.params) AS 'Points', "
+                "datetime(MAX(COALESCE(p.created, s.created)), 'unixepoch') AS 'Updated' "
+                "FROM studies s LEFT JOIN points p ON p.study_id = s.id GROUP BY s.id "
+                "ORDER BY MAX(COALESCE(p.created, s.created)) DESC",
+                connection)
+
+    def add(self, studyId:int, records:list):
+        """Store the records of evaluated points; failed ones are skipped so a resume retries."""
+        rows = []
+        now = time.time()
+        for params, record in records:
+            if 'Error' in record:
+                continue
+            plain = {name: _plain(value) for name, value in record.items()}
+            rows.append((studyId, point_key(params), json.dumps(plain), now))
+        if rows:
+            with closing(self._connect()) as connection, connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO points (study_id, params, record, created) "
+                    "VALUES (?, ?, ?, ?)", rows)
+
+    def records(self, studyId:int) -> dict:
+        """{point key: record} of every point the study holds."""
+        with closing(self._connect()) as connection:
+            rows = connection.execute("SELECT params, record FROM points WHERE study_id = ?",
+                                      (studyId,)).fetchall()
+        return {params: json.loads(record) for params, record in rows}
+
+    def study_frame(self, studyId:int) -> pd.DataFrame:
+        """Every record of a study as one frame."""
+        return pd.DataFrame(list(self.records(studyId).values()))
+
+class Study:
+    """Handle on one study, what the optimizer runs read from and write to."""
+    def __init__(self, store:StudyStore, studyId:int):
+        self.store = store
+        self.id = studyId
+
+    def evaluated(self) -> dict:
+        return self.store.records(self.id)
+
+    def record(self, names:list, records:list):
+        """Store records, their parameters being the values under names."""
+        self.store.add(self.id, [({name: record[name] for name in names}, record)
+                                 for record in records])
+
+    def frame(self) -> pd.DataFrame:
+        return self.store.study_frame(self.id)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_study_store(path:str = STUDY_PATH) -> StudyStore:
+    """Process-wide study store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = StudyStore(path)
+        return _store
@@ -0,0 +1,184 @@
+# Search index over the ticker lists in data/tickerList
+#
+# The index is built once from the CSVs and pickled next to them. Prefix lookups are a
+# binary search over a sorted key list; fuzzy lookups score trigram overlap with one
+# numpy bincount, so both stay well under a millisecond on the ~31k listed symbols.
+
+import os
+import pickle
+import bisect
+import threading
+import numpy as np
+import pandas as pd
+
+TICKER_LISTS = ["data/tickerList/us_companies.csv", "data/tickerList/indian_companies.csv"]
+INDEX_PATH = "data/tickerList/tickerIndex.pkl"
+INDEX_VERSION = 2
+
+_index = None
+_index_lock = threading.Lock()
+
+def _normalize(text:str) -> str:
+    return " ".join(str(text).lower().replace(",", " ").replace(".", " ").split())
+
+def _trigrams(text:str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TickerIndex:
+    def __init__(self, listing:pd.DataFrame):
+        listing = listing.fillna("")
+        self.tickers = listing["Ticker"].astype(str).tolist()
+        self.names = listing["Name"].astype(str).tolist()
+        self.exchanges = np.array(listing["Exchange"].astype(str).tolist(), dtype=object)
+        self.categories = np.array(listing["Category Name"].astype(str).tolist(), dtype=object)
+        self.countries = listing["Country"].astype(str).tolist()
+
+        # prefix keys: the ticker, the full name and every word of the name, normalized like queries
+        self.normalizedTickers = [_normalize(ticker) for ticker in self.tickers]
+        keys = []
+        for i, (ticker, name) in enumerate(zip(self.normalizedTickers, self.names)):
+            normalizedName = _normalize(name)
+            keys.append((ticker, 0, i))
+            if normalizedName:
+                keys.append((normalizedName, 1, i))
+                for word in set(normalizedName.split()[1:]):
+                    keys.append((word, 2, i))
+        keys.sort()
+        self.keys = [key for key, _, _ in keys]
+        self.keyKinds = np.array([kind for _, kind, _ in keys], dtype=np.int8)
+        self.keyIds = np.array([i for _, _, i in keys], dtype=np.int32)
+
+        postings = {}
+        self.trigramCounts = np.zeros(len(self.tickers), dtype=np.int32)
+        for i, (ticker, name) in enumerate(zip(self.normalizedTickers, self.names)):
+            grams = _trigrams(ticker) | _trigrams(_normalize(name))
+            self.trigramCounts[i] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self.filterMasks = {}
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    def _allowed(self, exchange = None, category = None):
+        if exchange is None and category is None:
+            return None
+        key = (exchange if isinstance(exchange, (str, type(None))) else tuple(exchange),
+               category if isinstance(category, (str, type(None))) else tuple(category))
+        if key not in self.filterMasks:
+            self.filterMasks[key] = self._filter_mask(exchange, category)
+        return self.filterMasks[key]
+
+    def _filter_mask(self, exchange, category):
+        allowed = np.ones(len(self.tickers), dtype=bool)
+        if exchange is not None:
+            allowed &= np.isin(self.exchanges, [exchange] if isinstance(exchange, str) else list(exchange))
+        if category is not None:
+            allowed &= np.isin(self.categories, [category] if isinstance(category, str) else list(category))
+        return allowed
+
+    def prefix(self, query:str, limit:int = 20, allowed = None) -> list:
+        query = _normalize(query)
+        if not query:
+            return []
+        first = bisect.bisect_left(self.keys, query)
+        last = bisect.bisect_left(self.keys, query + "￿", lo=first)
+        ids, kinds = self.keyIds[first:last], self.keyKinds[first:last]
+        if allowed is not None:
+            keep = allowed[ids]
+            ids, kinds = ids[keep], kinds[keep]
+        # ticker matches rank above name matches, exact tickers above everything
+        exact = np.array([self.normalizedTickers[i] == query for i in ids], dtype=bool)
+        order = np.lexsort((kinds, ~exact))
+        seen = []
+        for i in ids[order]:
+            if i not in seen:
+                seen.append(int(i))
+                if len(seen) == limit:
+                    break
+        return seen
+
+    def fuzzy(self, query:str, limit:int = 20, allowed = None) -> list:
+        grams = [gram for gram in _trigrams(_normalize(query)) if gram in self.postings]
+        if not grams:
+            return []
+        hits = np.bincount(np.concatenate([self.postings[gram] for gram in grams]), minlength=len(self.tickers))
+        # share of the query's trigrams found in the listing, shorter listings win ties
+        score = hits / len(_trigrams(_normalize(query)))
+        if allowed is not None:
+            score[~allowed] = 0.0
+        candidates = np.flatnonzero(score >= 0.4)
+        best = candidates[np.lexsort((self.trigramCounts[candidates], -score[candidates]))[:limit]]
+        return [int(i) for i in best]
+
+    def search(self, query:str, limit:int = 20, exchange = None, category = None, fuzzy:bool = True) -> list:
+        allowed = self._allowed(exchange, category)
+        ids = self.prefix(query, limit, allowed)
+        if fuzzy and len(ids) < limit:
+            ids += [i for i in self.fuzzy(query, limit, allowed) if i not in ids][:limit - len(ids)]
+        return [self.record(i) for i in ids]
+
+    def record(self, i:int) -> dict:
+        return {
+            "Ticker": self.tickers[i],
+            "Name": self.names[i],
+            "Exchange": self.exchanges[i],
+            "Category Name": self.categories[i],
+            "Country": self.countries[i],
+        }
+
+    def exchange_names(self) -> list:
+        return sorted(set(self.exchanges) - {""})
+
+    def category_names(self) -> list:
+        return sorted(set(self.categories) - {""})
+
+def build_index(tickerLists:list = TICKER_LISTS, indexPath:str = INDEX_PATH) -> TickerIndex:
+    listing = pd.concat([pd.read_csv(path, dtype=str) for path in tickerLists], ignore_index=True)
+    listing = listing.dropna(subset=["Ticker"]).drop_duplicates(subset=["Ticker"])
+    index = TickerIndex(listing)
+    tmpPath = indexPath + ".tmp"
+    with open(tmpPath, "wb") as f:
+        # plain state rather than the object, so an index built from the command line loads anywhere
+        pickle.dump((INDEX_VERSION, index.__dict__), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpPath, indexPath)
+    return index
+
+def load_index(tickerLists:list = TICKER_LISTS, indexPath:str = INDEX_PATH) -> TickerIndex:
+    """Load the pickled index on first use, rebuilding it when a ticker list is newer."""
+    global _index
+    with _index_lock:
+        if _index is not None:
+            return _index
+        stale = not os.path.exists(indexPath) or any(
+            os.path.getmtime(path) > os.path.getmtime(indexPath) for path in tickerLists)
+        if not stale:
+            try:
+                with open(indexPath, "rb") as f:
+                    version, state = pickle.load(f)
+                if version == INDEX_VERSION:
+                    _index = TickerIndex.__new__(TickerIndex)
+                    _index.__dict__.update(state)
+            except (OSError, pickle.UnpicklingError, ValueError, EOFError):
+                pass
+        if _index is None:
+            _index = build_index(tickerLists, indexPath)
+        return _index
+
+def search_tickers(query:str, limit:int = 20, exchange = None, category = None, fuzzy:bool = True) -> list:
+    return load_index().search(query, limit, exchange, category, fuzzy)
+
+def check_exact_tickers(index:TickerIndex, sample:int = 500) -> list:
+    """Tickers, out of an even sample, that are not the first result of a search for themselves."""
+    step = max(1, len(index) // sample)
+    return [index.tickers[i] for i in range(0, len(index), step)
+            if index.search(index.tickers[i], limit=1, fuzzy=False) != [index.record(i)]]
+
+if __name__ == "__main__":
+    index = build_index()
+    print(f"Indexed {len(index)} tickers into {INDEX_PATH}")
+    missed = check_exact_tickers(index)
+    if missed:
+        print(f"Not found first by their own symbol: {', '.join(missed[:20])}")
@@ -0,0 +1,342 @@
+# Array-based backtest engine for the built-in signal strategies
+#
+# Indicators and buy/sell signals are computed over the whole close array, then simulate()
+# replays backtrader's default broker: one-share market orders placed on bar t fill at the
+# open of bar t+1, percentage commission on the fill value, short selling credits cash. Like
+# the broker's submit check, any order that would leave cash negative at its creation close is
+# rejected, and an order that opens or extends a position is also rejected when the fill
+# itself would. Ending values match the backtrader path to floating point noise.
+# Moving averages come from one cumulative sum; backtrader sums every window exactly with
+# math.fsum, so wherever a signal compares two values within rounding of each other, those
+# cells are recomputed with the exact sums before the comparison.
+# ma_crossover_sweep runs a whole grid of MovingAverageCrossover periods as matrices: every
+# moving average from one cumulative sum, crosses and simulation for many pairs per step.
+
+import math
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from priceFeed import PriceArrays
+
+# values per (pairs, bars) matrix in a parameter sweep chunk
+SWEEP_CELLS = 2_000_000
+
+def exact_sma(values:np.ndarray, period:int) -> np.ndarray:
+    """Simple moving average with backtrader's exactly rounded math.fsum window sums."""
+    out = np.full(len(values), np.nan)
+    if len(values) >= period:
+        windows = sliding_window_view(values, period)
+        out[period - 1:] = [math.fsum(window) for window in windows.tolist()]
+        out[period - 1:] /= period
+    return out
+
+def window_means(values:np.ndarray, period:int, cells:np.ndarray) -> np.ndarray:
+    """exact_sma of values at the bars in cells only."""
+    return np.array([math.fsum(values[k - period + 1:k + 1].tolist()) / period for k in cells])
+
+def sma(values:np.ndarray, period:int) -> np.ndarray:
+    """Simple moving average, NaN until period values are available, within rounding of exact_sma."""
+    values = np.asarray(values, dtype=np.float64)
+    if np.isnan(values).any():
+        # a NaN would poison the cumulative sum past its own windows
+        return exact_sma(values, period)
+    return sma_matrix(values, [period])[0]
+
+def exponential_smoothing(values:np.ndarray, period:int, alpha:float) -> np.ndarray:
+    """Exponential smoothing seeded with the SMA of the first period valid values."""
+    out = np.full(len(values), np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) < period:
+        return out
+    start = valid[0] + period - 1
+    out[start] = math.fsum(values[valid[0]:start + 1].tolist()) / period
+    # the recursion is inherently sequential, a plain loop over floats is the fastest exact form
+    alpha1 = 1.0 - alpha
+    prev = out[start]
+    tail = values[start + 1:].tolist()
+    smoothed = [0.0] * len(tail)
+    for i, value in enumerate(tail):
+        prev = prev * alpha1 + value * alpha
+        smoothed[i] = prev
+    out[start + 1:] = smoothed
+    return out
+
+def ema(values:np.ndarray, period:int) -> np.ndarray:
+    return exponential_smoothing(values, period, 2.0 / (1.0 + period))
+
+def smma(values:np.ndarray, period:int) -> np.ndarray:
+    return exponential_smoothing(values, period, 1.0 / period)
+
+def rsi(close:np.ndarray, period:int = 14) -> np.ndarray:
+    change = np.full(len(close), np.nan)
+    change[1:] = close[1:] - close[:-1]
+    up = np.where(np.isnan(change), np.nan, np.maximum(change, 0.0))
+    down = np.where(np.isnan(change), np.nan, np.maximum(-change, 0.0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = smma(up, period) / smma(down, period)
+        return 100.0 - 100.0 / (1.0 + rs)
+
+def bollinger(close:np.ndarray, period:int = 20, devfactor:float = 2.0, average = sma):
+    mid = average(close, period)
+    stddev = np.sqrt(np.abs(average(close * close, period) - mid * mid))
+    band = devfactor * stddev
+    return mid, mid + band, mid - band
+
+def macd(close:np.ndarray, fast:int = 12, slow:int = 26, signal:int = 9):
+    line = ema(close, fast) - ema(close, slow)
+    return line, ema(line, signal)
+
+def crossover(fast:np.ndarray, slow:np.ndarray) -> np.ndarray:
+    """+1 where fast crosses above slow, -1 where it crosses below, like bt.indicators.CrossOver.
+
+    Works along the last axis, so rows of lines give rows of crosses.
+    """
+    diff = fast - slow
+    n = diff.shape[-1]
+    # carry the last non-zero difference forward so touching lines do not count as a cross
+    nonzero = np.where(diff != 0.0, diff, np.nan)
+    valid = ~np.isnan(diff)
+    # the first valid difference counts even when it is zero
+    rows = np.flatnonzero(valid.reshape(-1, n).any(axis=1))
+    first = np.argmax(valid.reshape(-1, n)[rows], axis=1)
+    nonzero.reshape(-1, n)[rows, first] = diff.reshape(-1, n)[rows, first]
+    index = np.where(~np.isnan(nonzero), np.arange(n), 0)
+    np.maximum.accumulate(index, axis=-1, out=index)
+    carried = np.where(valid, np.take_along_axis(nonzero, index, axis=-1), np.nan)
+    previous = np.full(diff.shape, np.nan)
+    previous[..., 1:] = carried[..., :-1]
+    up = (previous < 0.0) & (fast > slow)
+    down = (previous > 0.0) & (fast < slow)
+    return up.astype(np.int8) - down.astype(np.int8)
+
+def _tolerance(close:np.ndarray) -> float:
+    # bound on how far a cumulative-sum average can be from the exact one
+    return 1e-9 * np.abs(close).max() if len(close) else 0.0
+
+class Indicators:
+    """Indicator arrays of one close series, each (indicator, parameters) computed once.
+
+    The exact_ variants carry backtrader's rounding everywhere, for indicators that backtrader
+    itself compares bar by bar.
+    """
+    def __init__(self, close:np.ndarray):
+        self.close = close
+        self._cache = {}
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def sma(self, period:int):
+        return self._cached(("sma", period), lambda: sma(self.close, period))
+
+    def exact_sma(self, period:int):
+        return self._cached(("exact_sma", period), lambda: exact_sma(self.close, period))
+
+    def rsi(self, period:int):
+        return self._cached(("rsi", period), lambda: rsi(self.close, period))
+
+    def bollinger(self, period:int, devfactor:float):
+        return self._cached(("bollinger", period, devfactor), lambda: bollinger(self.close, period, devfactor))
+
+    def exact_bollinger(self, period:int, devfactor:float):
+        return self._cached(("exact_bollinger", period, devfactor),
+                            lambda: bollinger(self.close, period, devfactor, exact_sma))
+
+    def ema(self, period:int):
+        return self._cached(("ema", period), lambda: ema(self.close, period))
+
+    def macd(self, fast:int, slow:int, signal:int):
+        def compute():
+            line = self.ema(fast) - self.ema(slow)
+            return line, ema(line, signal)
+        return self._cached(("macd", fast, slow, signal), compute)
+
+def _signals_from(buy:np.ndarray, sell:np.ndarray, ready:np.ndarray) -> np.ndarray:
+    signals = np.where(buy, 1, np.where(sell, -1, 0)).astype(np.int8)
+    signals[~ready] = 0
+    return signals
+
+# every signal function takes an optional Indicators so parameter sweeps share indicator arrays
+
+def ma_crossover_signals(close, short_period = 10, long_period = 50, indicators:Indicators = None):
+    indicators = indicators or Indicators(close)
+    fast, slow = indicators.sma(short_period), indicators.sma(long_period)
+    if short_period != long_period:
+        ties = np.flatnonzero(np.abs(fast - slow) <= _tolerance(close))
+        if len(ties):
+            fast, slow = fast.copy(), slow.copy()
+            fast[ties] = window_means(close, short_period, ties)
+            slow[ties] = window_means(close, long_period, ties)
+    cross = crossover(fast, slow)
+    ready = np.zeros(len(close), dtype=bool)
+    ready[max(short_period, long_period):] = True
+    return _signals_from(cross > 0, cross < 0, ready)
+
+def rsi_signals(close, rsi_period = 14, overbought = 70, oversold = 30, indicators:Indicators = None):
+    values = (indicators or Indicators(close)).rsi(rsi_period)
+    return _signals_from(values < oversold, values > overbought, ~np.isnan(values))
+
+def bollinger_signals(close, period = 20, devfactor = 2, indicators:Indicators = None):
+    mid, top, bot = (indicators or Indicators(close)).bollinger(period, devfactor)
+    # the variance is a difference of averages of squares, its error reaches the band divided by
+    # the deviation: top - mid is devfactor deviations
+    scale = np.abs(close).max() if len(close) else 0.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tolerance = _tolerance(close) * (1.0 + devfactor * devfactor * scale / (top - mid))
+        ties = np.flatnonzero((np.abs(close - top) <= tolerance) | (np.abs(close - bot) <= tolerance)
+                              | ((top == mid) & ~np.isnan(mid)))
+    if len(ties):
+        mid, top, bot = mid.copy(), top.copy(), bot.copy()
+        mean = window_means(close, period, ties)
+        band = devfactor * np.sqrt(np.abs(window_means(close * close, period, ties) - mean * mean))
+        mid[ties], top[ties], bot[ties] = mean, mean + band, mean - band
+    return _signals_from(close < bot, close > top, ~np.isnan(mid))
+
+def macd_signals(close, fast_ema = 12, slow_ema = 26, signal = 9, indicators:Indicators = None):
+    line, signal_line = (indicators or Indicators(close)).macd(fast_ema, slow_ema, signal)
+    return _signals_from(line > signal_line, line < signal_line, ~np.isnan(signal_line))
+
+SIGNALS = {
+    "MovingAverageCrossover": ma_crossover_signals,
+    "RSIStrategy": rsi_signals,
+    "BollingerBandsStrategy": bollinger_signals,
+    "MACDStrategy": macd_signals,
+}
+
+# parameters a whole grid of which can be simulated at once, per strategy
+SWEEPS = {
+    "MovingAverageCrossover": ("short_period", "long_period"),
+}
+
+def _builtin(strategy) -> bool:
+    # by identity, an uploaded class or spec carrying a built-in name runs its own code
+    import strategies
+    return isinstance(strategy, type) and getattr(strategies, strategy.__name__, None) is strategy
+
+def supports(strategy) -> bool:
+    return _builtin(strategy) and strategy.__name__ in SIGNALS
+
+def sweeps(strategy, names) -> bool:
+    """Whether a grid over the parameters names can go through a matrix sweep."""
+    return _builtin(strategy) and strategy.__name__ in SWEEPS and set(names) <= set(SWEEPS[strategy.__name__])
+
+def strategy_params(strategy, **params) -> dict:
+    merged = dict(strategy.params._getpairs())
+    merged.update(params)
+    return merged
+
+def _simulate_loop(signals, open_, close, start, cash, position, cashCurve, positionCurve, commission):
+    # exact sequential broker replay, used from the first bar where an order could be rejected
+    for k in range(start, len(close)):
+        size = int(signals[k - 1]) if k > 0 else 0
+        if size:
+            opening = position == 0 or (position > 0) == (size > 0)
+            pseudoCash = cash - size * close[k - 1] - commission * close[k - 1]
+            fillCash = cash - size * open_[k] - commission * open_[k]
+            if pseudoCash >= 0.0 and (not opening or fillCash >= 0.0):
+                cash = fillCash
+                position += size
+        cashCurve[k] = cash
+        positionCurve[k] = position
+    return cashCurve, positionCurve
+
+def simulate(signals:np.ndarray, open_:np.ndarray, close:np.ndarray, initial_cash:float, commission:float,
+             position:float = 0.0):
+    """Replay one-share market orders; returns the cash and position after every bar.
+
+    The first bar never trades, so a run can be continued from any bar by passing the arrays
+    from that bar on with its cash and position. A (runs, bars) matrix of signals replays
+    every row on the same prices at once.
+    """
+    n = len(close)
+    sizes = np.zeros(signals.shape)
+    sizes[..., 1:] = signals[..., :-1]
+    fills = -sizes * open_ - np.abs(sizes) * commission * open_
+    cashCurve = initial_cash + np.cumsum(fills, axis=-1)
+    positionCurve = position + np.cumsum(sizes, axis=-1)
+
+    # fast path: every order accepted. Verify the broker's cash checks held for all of them
+    cashBefore = np.empty(signals.shape)
+    cashBefore[..., 0] = initial_cash
+    cashBefore[..., 1:] = cashCurve[..., :-1]
+    positionBefore = np.empty(signals.shape)
+    positionBefore[..., 0] = position
+    positionBefore[..., 1:] = positionCurve[..., :-1]
+    opening = (sizes != 0) & ((positionBefore == 0) | (np.sign(positionBefore) == np.sign(sizes)))
+    createdClose = np.empty(n)
+    createdClose[0] = np.nan
+    createdClose[1:] = close[:-1]
+    pseudoCash = cashBefore - sizes * createdClose - np.abs(sizes) * commission * createdClose
+    rejected = ((sizes != 0) & ((pseudoCash < 0.0) | (opening & (cashBefore + fills < 0.0)))).reshape(-1, n)
+    # rows with a rejected order are replayed exactly from their first rejection
+    for row in np.flatnonzero(rejected.any(axis=1)):
+        first = int(np.argmax(rejected[row]))
+        _simulate_loop(signals.reshape(-1, n)[row], open_, close, first, cashBefore.reshape(-1, n)[row, first],
+                       positionBefore.reshape(-1, n)[row, first], cashCurve.reshape(-1, n)[row],
+                       positionCurve.reshape(-1, n)[row], commission)
+    return cashCurve, positionCurve
+
+def sma_matrix(close:np.ndarray, periods) -> np.ndarray:
+    """Simple moving averages of close for every period, one row each, from one cumulative sum."""
+    close = np.asarray(close, dtype=np.float64)
+    n = len(close)
+    # summing deviations from the mean keeps the running sum small and its rounding error with it
+    mean = close.mean() if n else 0.0
+    sums = np.zeros(n + 1)
+    np.cumsum(close - mean, out=sums[1:])
+    out = np.full((len(periods), n), np.nan)
+    for row, period in enumerate(periods):
+        if 0 < period <= n:
+            out[row, period - 1:] = mean + (sums[period:] - sums[:-period]) / period
+    return out
+
+def ma_crossover_sweep(close:np.ndarray, open_:np.ndarray, pairs:list, initial_cash, commission,
+                       chunkCells:int = SWEEP_CELLS):
+    """Simulate MovingAverageCrossover for every (short_period, long_period) pair at once.
+
+    Yields (pairs, cash, position) per chunk of pairs, (pairs, bars) curves each, with chunks
+    of at most chunkCells values per matrix.
+    """
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    open_ = np.asarray(open_, dtype=np.float64)
+    n = len(close)
+    periods = sorted({period for pair in pairs for period in pair})
+    averages = sma_matrix(close, periods)
+    tolerance = _tolerance(close)
+    row = {period: i for i, period in enumerate(periods)}
+    size = max(1, chunkCells // max(1, n))
+    for start in range(0, len(pairs), size):
+        chunk = pairs[start:start + size]
+        fast = averages[[row[short] for short, _ in chunk]]
+        slow = averages[[row[long] for _, long in chunk]]
+        # where two different averages are within rounding of each other, the order decides a
+        # cross: recompute those cells with the exact window sums the single-run path uses
+        distinct = np.array([short != long for short, long in chunk])[:, None]
+        rows, cells = np.nonzero((np.abs(fast - slow) <= tolerance) & distinct)
+        for i in np.unique(rows):
+            short, long = chunk[i]
+            ties = cells[rows == i]
+            fast[i, ties] = window_means(close, short, ties)
+            slow[i, ties] = window_means(close, long, ties)
+        cross = crossover(fast, slow)
+        ready = np.arange(n) >= np.array([max(pair) for pair in chunk])[:, None]
+        signals = _signals_from(cross > 0, cross < 0, ready)
+        cash, position = simulate(signals, open_, close, initial_cash, commission)
+        yield chunk, cash, position
+
+def run_vectorized(strategy, arrays:PriceArrays, initial_cash, commission, indicators:Indicators = None, **params):
+    """Backtest a built-in strategy on arrays; returns the same record as the backtrader path plus curves.
+
+    Runs over the same arrays can pass one Indicators set to share indicator values.
+    """
+    close = np.ascontiguousarray(arrays.close, dtype=np.float64)
+    signals = SIGNALS[strategy.__name__](close, indicators=indicators, **strategy_params(strategy, **params))
+    cash, position = simulate(signals, np.asarray(arrays.open, dtype=np.float64), close, initial_cash, commission)
+    equity = cash + position * close
+    result = {
+        'Strategy': strategy.__name__,
+        'Starting Value': initial_cash,
+        'Ending Value': float(equity[-1]) if len(equity) else initial_cash,
+    }
+    return result, {'equity': equity, 'position': position, 'signals': signals}
@@ -0,0 +1,140 @@
+# Walk-forward optimization of the built-in strategies
+#
+# History is split into rolling train/test windows. Each window picks the best parameters on
+# its train slice and trades them on the following test slice, and the test slices are chained
+# into one out-of-sample equity curve. Signals for every parameter combination are computed
+# once over the whole history with the vectorized engine, so indicators carry their warm-up
+# from earlier bars and no window recomputes them. The signal matrix and prices go into shared
+# memory once; windows are independent and are scored in parallel on the worker pool.
+
+import itertools
+from multiprocessing import shared_memory
+from concurrent.futures import as_completed
+import numpy as np
+import pandas as pd
+from analytics import max_drawdown, sharpe
+from backtestRunner import get_pool
+from priceFeed import PriceArrays, attach_arrays, share_arrays
+import vectorBacktest
+
+def _ending_value(equity):
+    return float(equity[-1])
+
+def _return_over_drawdown(equity):
+    # a gain without any drawdown beats every ratio, gains among those are ranked by ending value
+    drawdown = max_drawdown(equity)
+    change = equity[-1] / equity[0] - 1.0
+    if drawdown > 0:
+        return float(change / drawdown)
+    return np.inf if change > 0 else 0.0
+
+def _sharpe(equity):
+    # a flat curve has no Sharpe ratio, it ranks below every curve that has one
+    ratio = float(sharpe(equity))
+    return ratio if np.isfinite(ratio) else -np.inf
+
+METRICS = {
+    "Ending Value": _ending_value,
+    "Return / Drawdown": _return_over_drawdown,
+    "Sharpe": _sharpe,
+}
+
+def walk_forward_windows(bars:int, train:int, test:int, step:int = None, anchored:bool = False) -> list:
+    """(trainStart, trainEnd, testStart, testEnd) bar ranges, end exclusive."""
+    if train <= 0 or test <= 0:
+        raise ValueError("train and test must be positive")
+    step = step or test
+    windows = []
+    start = 0
+    while start + train + test <= bars:
+        trainStart = 0 if anchored else start
+        windows.append((trainStart, start + train, start + train, start + train + test))
+        start += step
+    return windows
+
+def parameter_grid(grid:dict) -> list:
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(list(grid[name]) for name in names))]
+
+def signal_matrix(strategy, close:np.ndarray, combinations:list) -> np.ndarray:
+    """int8 signals of every combination over the full history, one row per combination."""
+    signalsFor = vectorBacktest.SIGNALS[strategy.__name__]
+    defaults = vectorBacktest.strategy_params(strategy)
+    # moving averages and oscillators repeat across combinations, each is computed once
+    indicators = vectorBacktest.Indicators(close)
+    signals = np.empty((len(combinations), len(close)), dtype=np.int8)
+    for row, params in enumerate(combinations):
+        signals[row] = signalsFor(close, indicators=indicators, **{**defaults, **params})
+    return signals
+
+def _simulate_slice(signals, arrays, start, end, initial_cash, commission):
+    cash, position = vectorBacktest.simulate(signals[start:end], arrays.open[start:end], arrays.close[start:end],
+                                             initial_cash, commission)
+    return cash + position * arrays.close[start:end]
+
+def _run_window(window, signalDescriptor, priceDescriptor, initial_cash, commission, metric):
+    trainStart, trainEnd, testStart, testEnd = window
+    signalBlock = shared_memory.SharedMemory(name=signalDescriptor[0])
+    priceBlock, arrays = attach_arrays(priceDescriptor)
+    signals = None
+    try:
+        signals = np.ndarray(signalDescriptor[1], dtype=np.int8, buffer=signalBlock.buf)
+        score = METRICS[metric]
+        scores, endings = np.empty(len(signals)), np.empty(len(signals))
+        for row, rowSignals in enumerate(signals):
+            equity = _simulate_slice(rowSignals, arrays, trainStart, trainEnd, initial_cash, commission)
+            scores[row], endings[row] = score(equity), equity[-1]
+        # equal scores go to the higher ending value, then to the earlier combination
+        best = int(np.lexsort((-np.arange(len(signals)), endings, scores))[-1])
+        testEquity = _simulate_slice(signals[best], arrays, testStart, testEnd, initial_cash, commission)
+        return window, best, float(scores[best]), np.array(testEquity)
+    finally:
+        del signals, arrays
+        signalBlock.close()
+        priceBlock.close()
+
+def walk_forward(strategy, arrays:PriceArrays, grid:dict, train:int, test:int, initial_cash, commission,
+                 step:int = None, anchored:bool = False, metric:str = "Ending Value", maxWorkers:int = None):
+    """Returns a per-window table and the stitched out-of-sample equity as a Series."""
+    if not vectorBacktest.supports(strategy):
+        raise ValueError(f"Walk-forward needs a vectorized strategy, {strategy.__name__} is not one")
+    windows = walk_forward_windows(len(arrays), train, test, step, anchored)
+    if not windows:
+        raise ValueError(f"{len(arrays)} bars are not enough for a {train} bar train and {test} bar test window")
+    combinations = parameter_grid(grid)
+    signals = signal_matrix(strategy, np.ascontiguousarray(arrays.close, dtype=np.float64), combinations)
+
+    signalBlock = shared_memory.SharedMemory(create=True, size=max(1, signals.nbytes))
+    np.ndarray(signals.shape, dtype=np.int8, buffer=signalBlock.buf)[:] = signals
+    priceBlock, priceDescriptor = share_arrays(arrays)
+    try:
+        pool = get_pool(maxWorkers)
+        futures = [pool.submit(_run_window, window, (signalBlock.name, signals.shape), priceDescriptor,
+                               initial_cash, commission, metric) for window in windows]
+        outcomes = sorted((future.result() for future in as_completed(futures)), key=lambda outcome: outcome[0])
+    finally:
+        signalBlock.close()
+        signalBlock.unlink()
+        priceBlock.close()
+        priceBlock.unlink()
+
+    dates = arrays.dates.view("datetime64[ns]")
+    rows, pieces = [], []
+    capital = float(initial_cash)
+    for i, ((trainStart, trainEnd, testStart, testEnd), best, trainScore, testEquity) in enumerate(outcomes):
+        # with step < test the windows overlap, each one only trades until the next takes over
+        cut = min(testEnd, outcomes[i + 1][0][2]) if i + 1 < len(outcomes) else testEnd
+        # every test window starts flat with initial_cash, chain them by compounding their returns
+        scaled = capital * testEquity[:cut - testStart] / initial_cash
+        pieces.append(pd.Series(scaled, index=dates[testStart:cut]))
+        # the part of the test window that made it into the stitched curve
+        rows.append({
+            'Train Start': dates[trainStart],
+            'Test Start': dates[testStart],
+            'Test End': dates[cut - 1],
+            **combinations[best],
+            f'Train {metric}': trainScore,
+            'Test Return %': (testEquity[cut - testStart - 1] / initial_cash - 1.0) * 100.0,
+        })
+        capital = float(scaled[-1])
+    return pd.DataFrame(rows), pd.concat(pieces).rename("Out-of-sample Equity")